@@ -0,0 +1,314 @@
+# This file looks inside the articles themselves, not only at their headlines
+# Lots of environmental stories have headlines that don't contain any of the KEYWORDS (like
+# "What the new budget means for Michigan's lakes"), so for the articles whose headline did not
+# match, this downloads the article page, pulls out its main text, and checks that text instead
+
+# Downloading every article on every crawl would be far too slow (and rude to the websites), so:
+#   - every article body is only ever downloaded and parsed once: the extracted text is kept in a
+#     SQLite database, keyed by the article's url (and the hash of the page, so the same page
+#     under a second url isn't parsed again either)
+#   - articles that were already checked with the current keywords are skipped completely
+#   - at most PER_HOST_LIMIT pages are downloaded from the same website at once,
+#     and at most MAX_BODIES_PER_CRAWL new articles are downloaded per website per crawl
+#     (the rest are picked up by the next crawls)
+#   - the downloads happen in the background, a crawl never waits for them: it only uses the bodies
+#     that were already downloaded, and the articles downloaded meanwhile are picked by the next crawls
+#     (so a slow website never holds up the headlines, or counts as a failed website)
+
+import os
+
+# the database file the article bodies are kept in (delete it to download every body again)
+BODY_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'article_bodies.db')
+
+# maximum number of article pages downloaded at the same time, in total and per website
+MAX_IN_FLIGHT = 8
+PER_HOST_LIMIT = 2
+
+# maximum number of article pages downloaded for one website in one crawl
+MAX_BODIES_PER_CRAWL = 50
+
+# paragraphs with fewer words than this are skipped (captions, bylines, "share this" links, ...)
+MIN_PARAGRAPH_WORDS = 8
+
+# an article's text only counts as matching the keywords if it contains at least this many different
+# keywords (as whole words, and "climate" inside "climate change" doesn't count separately), because a
+# whole article mentions a couple of them in passing ("utility", "permits", ...) far more easily than a headline does
+MIN_BODY_KEYWORDS = 3
+
+# only the first this many characters of an article are kept
+MAX_BODY_CHARACTERS = 20000
+
+
+#######################################################
+## Configuration Ends Here, Actual Code Begins Below ##
+#######################################################
+
+import hashlib
+import sqlite3
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from bs4 import SoupStrainer
+
+import http_client
+import metrics
+from article_store import normalize_url
+from filter_for_keywords import get_matcher, KeywordMatcher
+from html_parsing import make_soup
+
+
+"""
+    html is the raw html of an article page
+
+    returns the main text of the article: every long enough <p> paragraph, joined together
+    only the <p> tags are parsed, which is much faster than building the whole page
+"""
+def extract_main_text(html):
+    if not html:
+        return ''
+    soup = make_soup(html, 'lxml', parse_only=SoupStrainer('p'))
+
+    paragraphs = []
+    length = 0
+    for paragraph in soup.find_all('p'):
+        text = ' '.join(paragraph.get_text(' ').split())
+        if len(text.split()) < MIN_PARAGRAPH_WORDS:
+            continue
+        paragraphs.append(text)
+        length += len(text)
+        if length >= MAX_BODY_CHARACTERS:
+            break
+
+    return '\n'.join(paragraphs)[:MAX_BODY_CHARACTERS]
+
+
+# the matcher bodies are checked with: the same keywords as the headlines, but only as whole words
+# (so 'ber' doesn't match 'number' and 'October', which nearly every article contains)
+def _body_matcher(keywords):
+    if isinstance(keywords, KeywordMatcher):
+        keywords = keywords.keywords
+    return get_matcher(keywords, word_boundaries=True)
+
+
+# whether the text of an article is relevant, mode is the same as for filter_for_keywords.filter_relevant
+def _is_relevant_body(body, keywords, mode):
+    kept_by_keywords = len(_body_matcher(keywords).find_longest(body)) >= MIN_BODY_KEYWORDS
+    if mode == 'keywords':
+        return kept_by_keywords
+
+    # only imported when the model is actually used, because it needs numpy
+    from relevance_scorer import filter_for_relevance
+    kept_by_model = bool(filter_for_relevance({body: ''}))
+    if mode == 'model':
+        return kept_by_model
+    if mode == 'either':
+        return kept_by_keywords or kept_by_model
+    return kept_by_keywords and kept_by_model
+
+
+# a string that changes whenever the way bodies are checked changes,
+# so bodies checked with other keywords (or another mode, or a retrained model) are checked again
+def _classifier_key(keywords, mode):
+    matcher = _body_matcher(keywords)
+    key = (mode, matcher.keywords, 'whole words', MIN_BODY_KEYWORDS)
+    if mode != 'keywords':
+        # only imported when the model is actually used, because it needs numpy
+        from relevance_scorer import MODEL_PATH, load_scorer
+        # retraining the model rewrites the file, and may change its threshold
+        key += (os.path.getmtime(MODEL_PATH), load_scorer(MODEL_PATH).threshold)
+    return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+
+"""
+    the article body stage, and its cache of every body downloaded so far
+"""
+class ArticleBodies:
+    def __init__(self, path=BODY_CACHE_PATH, max_in_flight=MAX_IN_FLIGHT, per_host_limit=PER_HOST_LIMIT):
+        self.path = path
+        self.per_host_limit = per_host_limit
+
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='article-body')
+
+        # the url_keys being downloaded right now, so the next crawls don't download them a second time
+        self._downloading = set()
+        self._downloading_lock = threading.Lock()
+
+        # one semaphore per website, so no website gets more than per_host_limit downloads at once
+        self._host_semaphores = {}
+        self._host_semaphores_lock = threading.Lock()
+
+        # one connection shared by every thread, the lock makes sure only one uses it at a time
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+        with self._lock, self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.executescript('''
+                CREATE TABLE IF NOT EXISTS article_bodies (
+                    url_key TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    -- the extracted main text, zlib compressed
+                    body BLOB NOT NULL,
+                    -- the _classifier_key the body was last checked with, and whether it was relevant
+                    classifier TEXT,
+                    relevant INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS article_bodies_by_content_hash ON article_bodies (content_hash);
+            ''')
+
+    """
+        articles is a {"headline": "url"} dictionary of articles whose headlines didn't match
+        keywords and mode are the same as for filter_for_keywords.filter_relevant
+        only the bodies that were already downloaded are checked, the others are downloaded in the
+        background (unless download is False), and checked by the time a later crawl asks for them
+
+        returns a {"headline": "url"} dictionary of the articles whose body is relevant
+    """
+    def find_relevant(self, articles, keywords, mode='keywords', download=True):
+        classifier = _classifier_key(keywords, mode)
+        url_keys = {headline: normalize_url(url) for headline, url in articles.items()}
+        known = self._load(set(url_keys.values()), classifier)
+
+        relevant = {}
+        to_check = {}
+        to_download = {}
+        for headline, url in articles.items():
+            row = known.get(url_keys[headline])
+            if row is None:
+                if download and len(to_download) < MAX_BODIES_PER_CRAWL:
+                    to_download[headline] = url
+            elif row[1] == classifier:
+                # already checked with these keywords, nothing to do
+                if row[2]:
+                    relevant[headline] = url
+            else:
+                # downloaded before, but checked with other keywords
+                to_check[headline] = zlib.decompress(row[0]).decode('utf-8')
+
+        if to_download:
+            self._download_in_background(to_download, url_keys, keywords, mode, classifier)
+
+        checked = {}
+        for headline, body in to_check.items():
+            is_relevant = _is_relevant_body(body, keywords, mode)
+            checked[url_keys[headline]] = int(is_relevant)
+            if is_relevant:
+                relevant[headline] = articles[headline]
+        self._save_classifications(checked, classifier)
+
+        # keep the original article order
+        return {headline: url for headline, url in articles.items() if headline in relevant}
+
+    # starts downloading (and checking) the bodies of the {"headline": "url"} articles, without waiting for them
+    def _download_in_background(self, articles, url_keys, keywords, mode, classifier):
+        # the downloads happen in other threads, which have to label their measurements with this site
+        site = metrics.current_site()
+        for headline, url in articles.items():
+            url_key = url_keys[headline]
+            with self._downloading_lock:
+                if url_key in self._downloading:
+                    continue
+                self._downloading.add(url_key)
+            self._pool.submit(self._download_and_check, url, url_key, site, keywords, mode, classifier)
+
+    # runs in one of the pool's threads
+    def _download_and_check(self, url, url_key, site, keywords, mode, classifier):
+        try:
+            body = self._download(url, url_key, site)
+            if body is not None:
+                self._save_classifications({url_key: int(_is_relevant_body(body, keywords, mode))}, classifier)
+        except Exception as error:
+            # nobody waits for this thread, so say what went wrong here, it's tried again on the next crawl
+            print('Could not check the article ' + url + ': ' + str(error))
+        finally:
+            with self._downloading_lock:
+                self._downloading.discard(url_key)
+
+    # {url_key: (compressed body, classifier, relevant)} of the url_keys that were already downloaded
+    # the body is only read out of the database if it wasn't checked with classifier yet
+    def _load(self, url_keys, classifier):
+        url_keys = list(url_keys)
+        rows = {}
+        with self._lock:
+            # sqlite limits the number of ? in a query, so look them up in chunks
+            for start in range(0, len(url_keys), 500):
+                chunk = url_keys[start:start + 500]
+                rows.update(
+                    (url_key, (body, row_classifier, relevant))
+                    for url_key, body, row_classifier, relevant in self._connection.execute(
+                        'SELECT url_key, CASE WHEN classifier = ? THEN NULL ELSE body END, classifier, relevant'
+                        ' FROM article_bodies WHERE url_key IN (' + ', '.join('?' * len(chunk)) + ')',
+                        [classifier] + chunk,
+                    )
+                )
+        return rows
+
+    # downloads an article page and returns its main text (or None if it couldn't be downloaded)
+    # runs in one of the pool's threads
+    def _download(self, url, url_key, site):
+        with metrics.site_label(site), self._host_semaphore(urlsplit(url).netloc):
+            try:
+                content = http_client.fetch(url)
+            except requests.HTTPError as error:
+                metrics.errors.inc(site=site, stage='body')
+                status_code = error.response.status_code if error.response is not None else None
+                if status_code is None or status_code == 429 or status_code >= 500:
+                    # the website is having trouble, it's tried again on the next crawl
+                    print('Could not download the article ' + url + ': ' + str(error))
+                    return None
+                # the article is gone (404 and such), so remember it as an article without any text
+                content = b''
+            except Exception as error:
+                # it's tried again on the next crawl
+                metrics.errors.inc(site=site, stage='body')
+                print('Could not download the article ' + url + ': ' + str(error))
+                return None
+
+            content_hash = hashlib.sha1(content).hexdigest()
+            with self._lock:
+                # the same page was already parsed under another url
+                row = self._connection.execute(
+                    'SELECT body FROM article_bodies WHERE content_hash = ? LIMIT 1', (content_hash,)
+                ).fetchone()
+
+            if row is not None:
+                compressed_body = row[0]
+                body = zlib.decompress(compressed_body).decode('utf-8')
+            else:
+                with metrics.timed('body'):
+                    body = extract_main_text(content)
+                compressed_body = zlib.compress(body.encode('utf-8'))
+
+            with self._lock, self._connection:
+                self._connection.execute('''
+                    INSERT INTO article_bodies (url_key, content_hash, body) VALUES (?, ?, ?)
+                    ON CONFLICT (url_key) DO UPDATE SET
+                        content_hash = excluded.content_hash,
+                        body = excluded.body,
+                        classifier = NULL,
+                        relevant = NULL
+                ''', (url_key, content_hash, compressed_body))
+            return body
+
+    def _host_semaphore(self, host):
+        with self._host_semaphores_lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_semaphores[host]
+
+    def _save_classifications(self, relevant_by_url_key, classifier):
+        if not relevant_by_url_key:
+            return
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'UPDATE article_bodies SET classifier = ?, relevant = ? WHERE url_key = ?',
+                [(classifier, relevant, url_key) for url_key, relevant in relevant_by_url_key.items()],
+            )
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+        with self._lock:
+            self._connection.close()
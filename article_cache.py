@@ -0,0 +1,280 @@
+# This file holds the result of the last crawl in memory, so that the website can
+# answer page views instantly instead of scraping every site on every page view
+
+# A background thread re-crawls every `ttl` seconds (stale-while-revalidate style):
+# while a refresh is running, page views keep getting the previous snapshot
+# instead of waiting for the refresh to finish
+
+# number of seconds a crawl result is considered fresh
+CACHE_TTL = 300
+
+# number of seconds to wait before trying again after a failed refresh, doubled after every
+# failure in a row (but never more than the ttl), the previous snapshot is served in the meantime
+RETRY_AFTER = 10
+
+
+#######################################################
+## Configuration Ends Here, Actual Code Begins Below ##
+#######################################################
+
+import asyncio
+import itertools
+import threading
+import time
+
+
+"""
+    refresh_function takes no arguments and returns the new snapshot
+    (e.g. the {"headline": "url"} dictionary of every scraped article)
+
+    ArticleCache.get() returns the last snapshot
+    only the very first call blocks, because there is no previous snapshot to return yet
+"""
+class ArticleCache:
+    def __init__(self, refresh_function, ttl=CACHE_TTL):
+        self.refresh_function = refresh_function
+        self.ttl = ttl
+
+        # the last crawl result, and the time.monotonic() at which it was made
+        self.snapshot = None
+        self.refreshed_at = None
+        # the time.monotonic() of the last failed refresh, and how many failed in a row
+        # (None and 0 once a refresh works again)
+        self.failed_at = None
+        self.failures = 0
+        # goes up by one every time the snapshot is replaced, so things made from a snapshot
+        # (like the rendered pages of page_cache.py) can tell when they're out of date
+        self.version = 0
+        self._versions = itertools.count(1)
+
+        # held for the whole duration of a refresh, so only one refresh runs at a time
+        self._refresh_lock = threading.Lock()
+        # set by invalidate(), makes the next get() start a refresh regardless of the ttl
+        self._invalidated = False
+        self._background_thread = None
+        self._background_thread_lock = threading.Lock()
+        self._wake_up = threading.Event()
+        # the crawl page views are following with stream(), None until the first one
+        self._streamed_crawl = None
+        self._streamed_crawl_lock = threading.Lock()
+
+    """
+        returns the last snapshot, starting a background refresh if it is stale
+    """
+    def get(self):
+        self._start_background_refresher()
+
+        if self.snapshot is None:
+            # nothing to serve yet, so wait for the first crawl
+            # (if another thread is already doing it, this waits for that one instead)
+            with self._refresh_lock:
+                if self.snapshot is None:
+                    self._refresh_locked()
+            return self.snapshot
+
+        if self.is_stale():
+            # wake up the background thread, which refreshes without blocking this request
+            self._wake_up.set()
+
+        return self.snapshot
+
+    def is_stale(self):
+        return (
+            self._invalidated
+            or self.refreshed_at is None
+            or time.monotonic() - self.refreshed_at > self.ttl
+        )
+
+    """
+        manual invalidation hook: the current snapshot keeps being served,
+        but a refresh is started right away
+    """
+    def invalidate(self):
+        self._invalidated = True
+        self._wake_up.set()
+
+    """
+        replaces the snapshot with one that was crawled somewhere else
+        (e.g. by a page view that streamed a fresh crawl to the browser)
+    """
+    def put(self, snapshot):
+        self._replace_snapshot(snapshot)
+
+    """
+        returns a SharedCrawl that page views can follow to show the articles of every website as
+        soon as that website is done (see SharedCrawl), or None if a refresh that can't be followed
+        is already running (the page view should wait for it with get() instead)
+
+        crawl_function takes no arguments and returns an iterable of (website name, articles) tuples,
+        it's only called if no crawl is running yet, every other page view follows that same crawl
+        once it's done, finish_function is called with no arguments and returns the new snapshot
+    """
+    def stream(self, crawl_function, finish_function):
+        with self._streamed_crawl_lock:
+            crawl = self._streamed_crawl
+            if crawl is not None and not crawl.done:
+                return crawl
+            # the streamed crawl is a refresh like any other, so it doesn't run at the same time as one
+            if not self._refresh_lock.acquire(blocking=False):
+                return None
+            crawl = self._streamed_crawl = SharedCrawl()
+
+        self._invalidated = False
+        threading.Thread(
+            target=self._run_streamed_crawl, args=(crawl, crawl_function, finish_function), daemon=True
+        ).start()
+        return crawl
+
+    # runs in its own thread, so the crawl finishes (and fills the cache) even if every page view following it is closed
+    def _run_streamed_crawl(self, crawl, crawl_function, finish_function):
+        try:
+            crawl.run(crawl_function())
+            self._replace_snapshot(finish_function())
+        except Exception as error:
+            print('Something went wrong while refreshing the article cache:')
+            print(error)
+            self.failed_at = time.monotonic()
+            self.failures += 1
+        finally:
+            crawl.finish()
+            self._refresh_lock.release()
+
+    """
+        re-crawls right now, in the calling thread
+        if a refresh is already running, this returns once it is done instead of starting another one
+    """
+    def refresh(self):
+        if not self._refresh_lock.acquire(blocking=False):
+            # someone else is refreshing, wait for them and use their result
+            with self._refresh_lock:
+                return self.snapshot
+        try:
+            self._refresh_locked()
+        finally:
+            self._refresh_lock.release()
+        return self.snapshot
+
+    def _refresh_locked(self):
+        self._invalidated = False
+        try:
+            snapshot = self.refresh_function()
+        except Exception as error:
+            # keep serving the previous snapshot if the crawl fails
+            print('Something went wrong while refreshing the article cache:')
+            print(error)
+            self.failed_at = time.monotonic()
+            self.failures += 1
+            return
+
+        self._replace_snapshot(snapshot)
+
+    def _replace_snapshot(self, snapshot):
+        self.snapshot = snapshot
+        self.refreshed_at = time.monotonic()
+        self.failed_at = None
+        self.failures = 0
+        # next() on a count is atomic, so two threads replacing the snapshot never get the same version
+        self.version = next(self._versions)
+
+    # the background thread is started lazily on the first get(),
+    # so that importing this file never starts crawling
+    def _start_background_refresher(self):
+        if self._background_thread is not None:
+            return
+        with self._background_thread_lock:
+            if self._background_thread is not None:
+                return
+            self._background_thread = threading.Thread(target=self._refresh_forever, daemon=True)
+            self._background_thread.start()
+
+    # the time.monotonic() at which the background thread should refresh next
+    # after a failed refresh that's a while after the failure, so a crawl that keeps failing
+    # (e.g. a locked database) isn't retried over and over without a break
+    def _next_refresh_at(self):
+        if self.failed_at is not None:
+            return self.failed_at + min(self.ttl, RETRY_AFTER * 2 ** (self.failures - 1))
+        if self.refreshed_at is None:
+            return time.monotonic() + self.ttl
+        return self.refreshed_at + self.ttl
+
+    def _refresh_forever(self):
+        while True:
+            # sleep until the snapshot gets stale, or until someone asks for a refresh
+            next_refresh_at = self._next_refresh_at()
+            self._wake_up.wait(timeout=max(0, next_refresh_at - time.monotonic()))
+            self._wake_up.clear()
+
+            # page views wake the thread up as long as the snapshot is stale, but only
+            # invalidate() skips the wait after a failed refresh
+            if self._invalidated or (self.is_stale() and time.monotonic() >= self._next_refresh_at()):
+                self.refresh()
+
+
+"""
+    the results of one crawl, which any number of page views can follow at the same time
+    each follower gets every (website name, articles) tuple of the crawl, from the first website
+    that was done, even if it started following after that
+
+    follow() is for threads, follow_async() for asyncio, which waits without holding a thread
+"""
+class SharedCrawl:
+    def __init__(self):
+        self.results = []
+        self.done = False
+        self._condition = threading.Condition()
+        # called once the next result is in (or the crawl is done), by the asyncio followers waiting for it
+        self._listeners = []
+
+    # adds the results of the crawl as they come in (the caller calls finish() afterwards, even if this raises)
+    def run(self, results):
+        for result in results:
+            with self._condition:
+                self.results.append(result)
+                self._notify()
+
+    def finish(self):
+        with self._condition:
+            self.done = True
+            self._notify()
+
+    def follow(self):
+        position = 0
+        while True:
+            with self._condition:
+                while position == len(self.results) and not self.done:
+                    self._condition.wait()
+                new_results = self.results[position:]
+                if not new_results:
+                    return
+            position += len(new_results)
+            yield from new_results
+
+    async def follow_async(self):
+        loop = asyncio.get_running_loop()
+        position = 0
+        while True:
+            changed = asyncio.Event()
+            with self._condition:
+                new_results = self.results[position:]
+                if not new_results and self.done:
+                    return
+                if not new_results:
+                    self._listeners.append(lambda: loop.call_soon_threadsafe(changed.set))
+
+            if not new_results:
+                await changed.wait()
+                continue
+            position += len(new_results)
+            for result in new_results:
+                yield result
+
+    # the caller holds the condition
+    def _notify(self):
+        self._condition.notify_all()
+        listeners, self._listeners = self._listeners, []
+        for listener in listeners:
+            try:
+                listener()
+            except RuntimeError:
+                # the follower's event loop was closed, so nobody is waiting anymore
+                pass
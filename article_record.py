@@ -0,0 +1,194 @@
+# This file holds the articles the website shows in memory, in a way that stays small while the
+# app runs for weeks with hundreds of websites
+
+# Every article is an Article record instead of an entry in a {"headline": "url"} dictionary:
+#   - the record uses __slots__, so it has no per-article __dict__
+#   - the website name (source) of every article is the same interned string
+#   - the start of every url (like https://www.bbc.com) is stored once in a shared table, and every
+#     article only keeps the rest of its url
+# The articles are kept in an ArticleWindow, which forgets an article once nobody has seen it for
+# WINDOW_MAX_AGE seconds, and the articles that were seen the longest ago once it holds more than
+# WINDOW_MAX_ARTICLES, so the memory used stays the same no matter how long the app runs
+
+# an article is forgotten once it hasn't been seen on its website for this many seconds
+# (it has to be longer than crawl_scheduler.MAX_INTERVAL, so articles that are still on their
+# website aren't forgotten between two crawls)
+WINDOW_MAX_AGE = 24 * 60 * 60
+
+# the most articles a window holds, the ones seen the longest ago are forgotten first
+WINDOW_MAX_ARTICLES = 20000
+
+# the most url starts shared between articles, urls on other hosts just keep their whole url
+MAX_URL_PREFIXES = 10000
+
+
+#######################################################
+## Configuration Ends Here, Actual Code Begins Below ##
+#######################################################
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from circuit_breaker import is_replayed
+
+# every shared url start, {url start: the same url start}, so every article can point to one string
+_url_prefixes = {}
+
+
+"""
+    returns the same string object for every source with the same name
+"""
+def intern_source(source):
+    return sys.intern(source)
+
+
+"""
+    splits the url into its start (scheme and host, e.g. https://www.bbc.com) and the rest
+    the start is the same string object for every url with the same start
+"""
+def split_url(url):
+    scheme_end = url.find('://')
+    if scheme_end == -1:
+        return '', url
+    path_start = url.find('/', scheme_end + 3)
+    if path_start == -1:
+        path_start = len(url)
+
+    prefix = url[:path_start]
+    # setdefault is atomic, so two threads never end up with two copies of the same start
+    shared_prefix = _url_prefixes.get(prefix)
+    if shared_prefix is None:
+        if len(_url_prefixes) >= MAX_URL_PREFIXES:
+            return '', url
+        shared_prefix = _url_prefixes.setdefault(prefix, prefix)
+    return shared_prefix, url[path_start:]
+
+
+"""
+    one article: its headline, url, the website it's from, and the time.time() it was first and last seen
+"""
+class Article:
+    __slots__ = ('headline', 'source', 'url_prefix', 'url_path', 'first_seen', 'last_seen')
+
+    def __init__(self, headline, url, source, seen_at):
+        # str() turns a bs4 NavigableString into a plain string, which doesn't keep its whole parse tree alive
+        self.headline = str(headline)
+        self.source = intern_source(source)
+        self.url_prefix, self.url_path = split_url(url)
+        self.first_seen = seen_at
+        self.last_seen = seen_at
+
+    @property
+    def url(self):
+        return self.url_prefix + self.url_path
+
+    def __repr__(self):
+        return f'Article({self.headline!r}, {self.url!r}, {self.source!r})'
+
+
+"""
+    the articles of a window at one moment, newest first
+    it looks like a {"headline": "url"} dictionary to the rest of the app (and templates/main.html),
+    without making one: items() goes through the records themselves
+"""
+class ArticleSnapshot:
+    __slots__ = ('articles',)
+
+    def __init__(self, articles):
+        # a tuple of Article
+        self.articles = articles
+
+    def items(self):
+        return ((article.headline, article.url) for article in self.articles)
+
+    def __iter__(self):
+        return (article.headline for article in self.articles)
+
+    def __len__(self):
+        return len(self.articles)
+
+    def __bool__(self):
+        return bool(self.articles)
+
+
+"""
+    the articles seen in the last max_age seconds, at most max_articles of them
+    (one article per headline, like in a {"headline": "url"} dictionary)
+
+    safe to use from many threads at once
+"""
+class ArticleWindow:
+    def __init__(self, max_age=WINDOW_MAX_AGE, max_articles=WINDOW_MAX_ARTICLES):
+        self.max_age = max_age
+        self.max_articles = max_articles
+
+        # {headline: Article}, the article seen the longest ago first
+        self._articles = OrderedDict()
+        self._lock = threading.Lock()
+
+    """
+        adds the {"headline": "url"} dictionary of one crawl of source
+        articles that are already in the window are marked as seen again, the others are added
+
+        the last good articles of a website that is being skipped (circuit_breaker.ReplayedArticles) weren't
+        seen again, so they are left out, and the ones still in the window are forgotten max_age after
+        they were last really seen
+    """
+    def update(self, source, articles, now=None):
+        if is_replayed(articles):
+            return
+
+        now = time.time() if now is None else now
+        source = intern_source(source)
+
+        with self._lock:
+            for headline, url in articles.items():
+                # keyed by the record's own plain string, never by a bs4 NavigableString
+                headline = str(headline)
+                url = str(url)
+                article = self._articles.get(headline)
+                if article is None:
+                    self._articles[headline] = Article(headline, url, source, now)
+                    continue
+
+                article.last_seen = now
+                article.source = source
+                if article.url != url:
+                    article.url_prefix, article.url_path = split_url(url)
+                self._articles.move_to_end(headline)
+
+            self._forget_old(now)
+
+    """
+        forgets every article of source (e.g. a website that was taken out of sites.json)
+    """
+    def remove_source(self, source):
+        with self._lock:
+            for headline in [headline for headline, article in self._articles.items() if article.source == source]:
+                del self._articles[headline]
+
+    """
+        returns an ArticleSnapshot of the articles in the window, the articles first seen last come
+        first, and the articles first seen in the same crawl keep the order their website had them in
+    """
+    def snapshot(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._forget_old(now)
+            articles = list(self._articles.values())
+        # sorted() is stable, so articles with the same first_seen stay in the same order
+        articles.sort(key=lambda article: article.first_seen, reverse=True)
+        return ArticleSnapshot(tuple(articles))
+
+    def __len__(self):
+        return len(self._articles)
+
+    # the caller holds the lock
+    def _forget_old(self, now):
+        while len(self._articles) > self.max_articles:
+            self._articles.popitem(last=False)
+        oldest_allowed = now - self.max_age
+        while self._articles and next(iter(self._articles.values())).last_seen < oldest_allowed:
+            self._articles.popitem(last=False)
@@ -0,0 +1,305 @@
+# This file keeps every scraped article in a SQLite database, so articles have a history
+# instead of only living in the {"headline": "url"} dictionary of the latest crawl
+
+# Articles are stored once per url (after normalizing it, see normalize_url below), so the same
+# story under two different headlines is only stored once. For every article we remember which
+# site it came from, and when it was first and last seen
+
+# The crawl also writes an inverted index from every keyword to the articles whose headline it
+# matched, so "every article about recycling" is a lookup in that index instead of running the
+# keyword filter over the whole history. search() pages through it (or the articles) with a cursor
+
+import os
+
+# the database file (delete it to start over with an empty history)
+ARTICLE_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'articles.db')
+
+# an article's last_seen time is only written again when it is older than this many seconds,
+# so a crawl that finds the same articles as last time writes (almost) nothing
+LAST_SEEN_RESOLUTION = 60 * 60
+
+# query parameters that only track where a click came from, and don't change the article
+TRACKING_PARAMETERS = {'fbclid', 'gclid', 'mc_cid', 'mc_eid', 'cmpid', 'ocid'}
+
+# the most articles search() returns at once
+MAX_PAGE_SIZE = 100
+
+
+#######################################################
+## Configuration Ends Here, Actual Code Begins Below ##
+#######################################################
+
+import base64
+import json
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from filter_for_keywords import get_matcher, normalize
+
+
+"""
+    takes in a url, and returns a version of it that is the same for every url pointing
+    to the same article, e.g. all of these become 'https://bbc.com/news/science-1':
+        https://www.bbc.com/news/science-1
+        https://bbc.com/news/science-1/
+        https://bbc.com/news/science-1?utm_source=twitter#comments
+"""
+def normalize_url(url):
+    parts = urlsplit(url.strip())
+
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[len('www.'):]
+
+    # remove tracking parameters, and sort the rest so their order doesn't matter
+    query = sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.lower().startswith('utm_') and name.lower() not in TRACKING_PARAMETERS
+    )
+
+    path = parts.path.rstrip('/') or '/'
+
+    # the fragment (#...) is dropped, it only points to a part of the same page
+    return urlunsplit((parts.scheme.lower(), host, path, urlencode(query), ''))
+
+
+"""
+    the persistent article history
+
+    record_crawl() saves the result of a crawl, and latest() / new_since() / search() read
+    articles back out using the indexes on first_seen, source and keyword
+"""
+class ArticleStore:
+    def __init__(self, path=ARTICLE_STORE_PATH):
+        self.path = path
+
+        # one connection shared by every thread, the lock makes sure only one uses it at a time
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+        # what was last written for each article: {url_key: (headline, source, last_seen)}
+        # used to only write the articles that actually changed since the last crawl
+        self._written = {}
+
+        with self._lock, self._connection:
+            # WAL lets the website read while a crawl is writing
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.executescript('''
+                CREATE TABLE IF NOT EXISTS articles (
+                    url_key TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    headline TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    first_seen REAL NOT NULL,
+                    last_seen REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS articles_by_last_seen ON articles (last_seen);
+
+                -- url_key is in these so that articles first seen in the same crawl
+                -- still have an order that search() can page through
+                DROP INDEX IF EXISTS articles_by_first_seen;
+                DROP INDEX IF EXISTS articles_by_source;
+                CREATE INDEX IF NOT EXISTS articles_in_order ON articles (first_seen, url_key);
+                CREATE INDEX IF NOT EXISTS articles_by_source_in_order ON articles (source, first_seen, url_key);
+
+                -- the inverted index: one row per keyword per article whose headline matched it
+                -- source and first_seen are copied in, so searches never have to look at other keywords
+                CREATE TABLE IF NOT EXISTS article_keywords (
+                    keyword TEXT NOT NULL,
+                    url_key TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    first_seen REAL NOT NULL,
+                    PRIMARY KEY (keyword, url_key)
+                );
+                CREATE INDEX IF NOT EXISTS article_keywords_in_order
+                    ON article_keywords (keyword, first_seen, url_key);
+                CREATE INDEX IF NOT EXISTS article_keywords_by_source_in_order
+                    ON article_keywords (keyword, source, first_seen, url_key);
+                CREATE INDEX IF NOT EXISTS article_keywords_by_url ON article_keywords (url_key);
+            ''')
+
+    """
+        articles_by_source is a dictionary of {"source name": {"headline": "url"}}
+        seen_at is the unix time of the crawl (defaults to now)
+        keywords is a list of keywords (or a KeywordMatcher), if given the keyword index is
+        updated with the keywords each new (or re-titled) article's headline matches
+
+        new articles are inserted, and for articles we already know only the ones whose
+        headline or source changed (or whose last_seen is getting old) are written again
+
+        returns the number of articles written
+    """
+    def record_crawl(self, articles_by_source, seen_at=None, keywords=None):
+        seen_at = time.time() if seen_at is None else seen_at
+        matcher = None if keywords is None else get_matcher(keywords)
+
+        rows = {}
+        for source, articles in articles_by_source.items():
+            for headline, url in articles.items():
+                # the same url under a second headline overwrites the first one
+                rows[normalize_url(url)] = (url, str(headline), source)
+
+        with self._lock:
+            changed_rows = []
+            # the articles whose keywords have to be (re)indexed: {url_key: matched keywords}
+            keyword_rows = {}
+            for url_key, (url, headline, source) in rows.items():
+                written = self._written.get(url_key)
+                unchanged = written is not None and written[0] == headline and written[1] == source
+                if unchanged and seen_at - written[2] < LAST_SEEN_RESOLUTION:
+                    continue
+                changed_rows.append((url_key, url, headline, source, seen_at, seen_at))
+                if matcher is not None and not unchanged:
+                    keyword_rows[url_key] = matcher.find_all(headline)
+
+            if not changed_rows:
+                return 0
+
+            with self._connection:
+                # first_seen is never overwritten, so it stays the time the article first showed up
+                self._connection.executemany('''
+                    INSERT INTO articles (url_key, url, headline, source, first_seen, last_seen)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (url_key) DO UPDATE SET
+                        url = excluded.url,
+                        headline = excluded.headline,
+                        source = excluded.source,
+                        last_seen = excluded.last_seen
+                ''', changed_rows)
+
+                if keyword_rows:
+                    self._index_keywords(keyword_rows)
+
+            for url_key, url, headline, source, _, last_seen in changed_rows:
+                self._written[url_key] = (headline, source, last_seen)
+
+        return len(changed_rows)
+
+    """
+        returns the limit most recently discovered articles as a {"headline": "url"} dictionary,
+        newest first, optionally only from the given list of sources
+    """
+    def latest(self, limit=50, sources=None):
+        return self._query('', [], sources, limit)
+
+    """
+        returns every article first seen after the unix time since, as a {"headline": "url"}
+        dictionary, newest first, optionally only from the given list of sources
+    """
+    def new_since(self, since, limit=None, sources=None):
+        return self._query('first_seen > ?', [since], sources, limit)
+
+    # replaces the keyword index rows of each article with its newly matched keywords
+    # (the caller holds the lock and the transaction)
+    def _index_keywords(self, keyword_rows):
+        self._connection.executemany(
+            'DELETE FROM article_keywords WHERE url_key = ?', [(url_key,) for url_key in keyword_rows]
+        )
+        # source and first_seen are copied from the article, first_seen is only known by the database
+        self._connection.executemany('''
+            INSERT INTO article_keywords (keyword, url_key, source, first_seen)
+            SELECT ?, url_key, source, first_seen FROM articles WHERE url_key = ?
+        ''', [
+            (keyword, url_key)
+            for url_key, matched_keywords in keyword_rows.items()
+            for keyword in matched_keywords
+        ])
+
+    """
+        one page of articles, newest first, as a list of
+        {"headline", "url", "source", "first_seen"} dictionaries
+
+        keyword only returns articles whose headline matched that keyword when they were crawled
+        (answered from the keyword index), source only the articles of that source,
+        since only the articles first seen after that unix time
+
+        cursor is the next_cursor of the previous page (None for the first page)
+
+        returns (articles, next_cursor), next_cursor is None on the last page
+        raises ValueError if the cursor is not one returned by search()
+    """
+    def search(self, keyword=None, source=None, since=None, limit=50, cursor=None):
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        # the keyword index has its own copy of source and first_seen,
+        # so every condition and the order can be answered by one of its indexes
+        if keyword is not None:
+            table = 'article_keywords AS k JOIN articles AS a ON a.url_key = k.url_key'
+            conditions, parameters = ['k.keyword = ?'], [normalize(keyword)]
+            indexed = 'k'
+        else:
+            table = 'articles AS a'
+            conditions, parameters = [], []
+            indexed = 'a'
+
+        if source is not None:
+            conditions.append(f'{indexed}.source = ?')
+            parameters.append(source)
+        if since is not None:
+            conditions.append(f'{indexed}.first_seen > ?')
+            parameters.append(since)
+        if cursor is not None:
+            # keyset pagination: continue right after the last article of the previous page,
+            # so a page deep into the history is just as fast as the first one
+            conditions.append(f'({indexed}.first_seen, {indexed}.url_key) < (?, ?)')
+            parameters.extend(_decode_cursor(cursor))
+
+        sql = f'SELECT a.headline, a.url, a.source, a.first_seen, a.url_key FROM {table}'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        # one extra row, to know whether there is a next page
+        sql += f' ORDER BY {indexed}.first_seen DESC, {indexed}.url_key DESC LIMIT ?'
+        parameters.append(limit + 1)
+
+        with self._lock:
+            rows = self._connection.execute(sql, parameters).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1][3], rows[-1][4])
+
+        articles = [
+            {'headline': headline, 'url': url, 'source': source, 'first_seen': first_seen}
+            for headline, url, source, first_seen, _ in rows
+        ]
+        return articles, next_cursor
+
+    def _query(self, condition, parameters, sources, limit):
+        conditions = [condition] if condition else []
+        if sources is not None:
+            sources = list(sources)
+            conditions.append('source IN (' + ', '.join('?' * len(sources)) + ')')
+            parameters = parameters + sources
+
+        sql = 'SELECT headline, url FROM articles'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY first_seen DESC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            parameters = parameters + [limit]
+
+        with self._lock:
+            return dict(self._connection.execute(sql, parameters).fetchall())
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+# a cursor is the (first_seen, url_key) of the last article of a page, in an url-safe string
+def _encode_cursor(first_seen, url_key):
+    return base64.urlsafe_b64encode(json.dumps([first_seen, url_key]).encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor):
+    try:
+        first_seen, url_key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError('invalid cursor')
+    if not isinstance(first_seen, (int, float)) or not isinstance(url_key, str):
+        raise ValueError('invalid cursor')
+    return first_seen, url_key
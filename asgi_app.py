@@ -0,0 +1,414 @@
+# This file serves the same website as main.py, but as an asyncio (ASGI) app instead of with
+# Flask's threaded server, so one process can answer many page views and wait on many websites at
+# the same time without a thread for every one of them
+# Run it with: uvicorn asgi_app:app --host 0.0.0.0 --port 8080
+# or just: python asgi_app.py
+# It needs aiohttp and uvicorn (poetry install -E asgi), main.py keeps working without them
+
+# Everything is set up in main.py like before (KEYWORDS, SCRAPERS, STREAM_PAGES, ...), what's different is:
+#   - '/' and '/generalized_scraper' are answered on the event loop, and every website is downloaded
+#     with async_http_client, so a page view waiting on (or streaming) a crawl doesn't hold a thread
+#   - the scrapers in website_scrapers are downloaded the same way (see scraper_registry.async_scraper)
+#   - parsing the html, filtering the articles and writing to sqlite happen in the event loop's
+#     thread pool, so they never hold up the other page views
+#   - the background re-crawls (article_cache.py and crawl_scheduler.py) hand their downloads to the
+#     event loop as well, their few threads only wait for the results
+#   - every other url (/api/articles, /metrics, /health, and the pages with ?since= or ?limit=, which
+#     only read the history in sqlite) is answered by the flask app of main.py, in a thread
+
+# host and port used by python asgi_app.py
+HOST = '0.0.0.0'
+PORT = 8080
+
+
+#######################################################
+## Configuration Ends Here, Actual Code Begins Below ##
+#######################################################
+
+import asyncio
+import io
+import sys
+from urllib.parse import parse_qs, urlsplit
+
+import jinja2
+
+import async_http_client
+import generalized_scraper
+import main
+import page_cache
+from article_cache import ArticleCache
+from article_record import ArticleWindow
+from async_scraping import scrape_concurrently_async, run_in_thread
+from concurrent_scraping import MAX_IN_FLIGHT, SITE_TIMEOUT
+from scraper_registry import load_scrapers, async_scraper, scraper_website
+from site_config import load_sites
+
+# the routes that can crawl the websites, so they are answered on the event loop
+PAGE_ROUTES = ('/', '/generalized_scraper')
+
+# the event loop the app runs on, the background crawls send their downloads to it
+_loop = None
+
+
+# runs the coroutine on the app's event loop, from one of the background threads, and returns its result
+def run_on_loop(coroutine):
+    return asyncio.run_coroutine_threadsafe(coroutine, _loop).result()
+
+
+# goes through an async generator on the app's event loop from a background thread, like a normal generator
+# (a streamed crawl runs in its own thread, see article_cache.ArticleCache.stream)
+def _iter_on_loop(async_generator):
+    async def next_item():
+        return await async_generator.__anext__()
+
+    while True:
+        try:
+            yield run_on_loop(next_item())
+        except StopAsyncIteration:
+            return
+
+
+"""
+    same as main.iter_articles, but an async generator that downloads without blocking the event loop
+"""
+async def iter_articles_async(scraper_functions, keywords, max_in_flight=MAX_IN_FLIGHT, timeout=SITE_TIMEOUT, store=None):
+    jobs = [(scraper_function.__name__, async_scraper(scraper_function)) for scraper_function in scraper_functions]
+
+    async for name, scraped_articles, error in scrape_concurrently_async(jobs, max_in_flight, timeout):
+        # a broken website shouldn't take the whole page down with it
+        if error is not None:
+            print('Something went wrong with: ' + name)
+            print('The error is:')
+            print(error)
+            continue
+
+        yield name, await run_in_thread(
+            generalized_scraper.keep_relevant,
+            name, scraped_articles, keywords, store, main.RELEVANCE_MODE, main.article_bodies_stage(),
+        )
+
+
+# waits for every website of the async generator, putting their articles into window as they finish,
+# and returns an ArticleSnapshot of the window (like main.get_articles)
+async def _fill_window(articles_by_name, window):
+    async for name, articles in articles_by_name:
+        window.update(name, articles)
+    return window.snapshot()
+
+
+# the articles of a single website, or None if it failed (a crawl job of the crawl scheduler)
+async def _crawl_one(articles_by_name):
+    async for _, articles in articles_by_name:
+        return articles
+    return None
+
+
+# the crawl scheduler jobs of the scrapers, like main.scraper_jobs
+def _scraper_jobs(scraper_functions):
+    store = main.get_article_store()
+    return [
+        (
+            scraper_function.__name__,
+            urlsplit(scraper_website(scraper_function) or '').netloc or scraper_function.__name__,
+            lambda scraper_function=scraper_function: run_on_loop(
+                _crawl_one(iter_articles_async([scraper_function], main.KEYWORDS, store=store))
+            ),
+        )
+        for scraper_function in scraper_functions
+    ]
+
+
+# the crawl scheduler of the scrapers, the same one for the background crawls and the streamed first crawl
+def _scrapers_scheduler(scraper_functions):
+    return main.get_scheduler('async scrapers', _scraper_jobs(scraper_functions), scrapers_cache, article_windows['/'])
+
+
+# does a full crawl with the scrapers in main.SCRAPERS, like main.crawl_scrapers (runs in the cache's thread)
+def crawl_scrapers():
+    scraper_functions = load_scrapers(main.SCRAPERS_FOLDER_NAME, main.SCRAPERS)
+    store = main.get_article_store()
+
+    if main.ADAPTIVE_CRAWLING:
+        return _scrapers_scheduler(scraper_functions).crawl_all()
+
+    return run_on_loop(_fill_window(
+        iter_articles_async(scraper_functions, main.KEYWORDS, store=store), article_windows['/']
+    ))
+
+
+# the articles of the recent crawls of each route (the windows of main.py belong to its own caches)
+article_windows = {route: ArticleWindow() for route in PAGE_ROUTES}
+
+
+# the websites (from sites.json) the generalized scraper crawled last, to notice when the file changes
+_crawled_websites = None
+
+
+# the async generator of (website name, articles) of a generalized scraper crawl of websites
+def _iter_websites(websites):
+    return generalized_scraper.iter_articles_async(
+        websites, keywords=main.KEYWORDS, store=main.get_article_store(), relevance_mode=main.RELEVANCE_MODE,
+        bodies=main.article_bodies_stage(),
+    )
+
+
+# the crawl scheduler of the generalized scraper, the same one for the background crawls and the streamed first crawl
+def _websites_scheduler(websites):
+    jobs = [
+        (
+            website['name'],
+            urlsplit(website['url']).netloc,
+            lambda website=website: run_on_loop(_crawl_one(_iter_websites([website]))),
+        )
+        for website in websites
+    ]
+    return main.get_scheduler(
+        'async generalized_scraper', jobs, generalized_scraper_cache, article_windows['/generalized_scraper']
+    )
+
+
+# does a full crawl with the generalized scraper, like main.crawl_generalized_scraper (runs in the cache's thread)
+def crawl_generalized_scraper():
+    global _crawled_websites
+    websites = _crawled_websites = load_sites()
+
+    if main.ADAPTIVE_CRAWLING:
+        return _websites_scheduler(websites).crawl_all()
+
+    return run_on_loop(_fill_window(_iter_websites(websites), article_windows['/generalized_scraper']))
+
+
+scrapers_cache = ArticleCache(crawl_scrapers, ttl=main.CRAWL_TTL)
+generalized_scraper_cache = ArticleCache(crawl_generalized_scraper, ttl=main.CRAWL_TTL)
+
+# the rendered pages of these caches (the versions of main.py's caches are different ones)
+page_caches = {
+    route: page_cache.PageCache(
+        lambda articles, page, page_count, route=route: main.render_main_page(route, articles, page, page_count)
+    )
+    for route in PAGE_ROUTES
+}
+
+# templates/main.html, rendered without blocking the event loop while a streamed crawl is running
+templates = jinja2.Environment(
+    loader=main.app.jinja_loader, autoescape=jinja2.select_autoescape(), enable_async=True
+)
+templates.filters['host'] = main.host_filter
+
+
+"""
+    same as main.StreamedArticles, but the articles of each website come from an async generator
+    (the follow_async() of a streamed crawl)
+"""
+class AsyncStreamedArticles(main.StreamedArticles):
+    async def items(self):
+        seen_headlines = set()
+        shown_stories = set()
+        async for _, website_articles in self.articles_by_website:
+            for article in self.articles_to_show(website_articles, seen_headlines, shown_stories):
+                yield article
+
+
+# answers '/' and '/generalized_scraper', like main.main and main.run_generalized_scraper
+async def serve_page(route, query, headers, send):
+    global _crawled_websites
+    if route == '/':
+        cache = scrapers_cache
+        scraper_functions = load_scrapers(main.SCRAPERS_FOLDER_NAME, main.SCRAPERS)
+        crawl = lambda: iter_articles_async(scraper_functions, main.KEYWORDS, store=main.get_article_store())
+        scheduler = lambda: _scrapers_scheduler(scraper_functions)
+    else:
+        cache = generalized_scraper_cache
+        websites = load_sites()
+        # sites.json changed since the last crawl, so crawl again in the background with the new websites
+        if _crawled_websites is not None and websites is not _crawled_websites:
+            cache.invalidate()
+        crawl = lambda: _iter_websites(websites)
+        scheduler = lambda: _websites_scheduler(websites)
+
+    try:
+        page = int(query.get('page', ['1'])[0])
+    except ValueError:
+        page = 1
+
+    # like main.should_stream, every page view that comes in before the first crawl is done follows the same crawl
+    if page == 1 and main.STREAM_PAGES and cache.snapshot is None:
+        streamed_crawl = main.stream_crawl(cache, article_windows[route], lambda: _iter_on_loop(crawl()), scheduler)
+    else:
+        streamed_crawl = None
+
+    if streamed_crawl is not None:
+        if route == '/generalized_scraper':
+            # like in main.run_generalized_scraper, so later edits of sites.json are noticed
+            _crawled_websites = websites
+        clusterer = main.headline_clusters[route] if main.DEDUPLICATE_HEADLINES else None
+        articles = AsyncStreamedArticles(streamed_crawl.follow_async(), clusterer=clusterer)
+        template = templates.get_template('main.html')
+        # stop proxies like nginx from holding on to the pieces until the page is complete
+        await _send_html(
+            send,
+            template.generate_async(articles=articles, other_urls=main.other_urls_function(route)),
+            [(b'x-accel-buffering', b'no')],
+        )
+        return
+
+    # like main.cached_page, a page that was already rendered is sent right away
+    version = cache.version
+    rendered = page_caches[route].lookup(version, page)
+    if rendered is None:
+        if cache.snapshot is None:
+            # nothing was crawled yet, so wait for the first crawl (in a thread, the crawl itself runs on the loop)
+            articles = await run_in_thread(cache.get)
+        else:
+            # the last crawl result (a refresh happens in the background once it gets older than the ttl)
+            articles = cache.get()
+        rendered = await run_in_thread(page_caches[route].get, version, lambda: main.deduplicate(route, articles), page)
+    else:
+        # still starts a background refresh once the crawl is too old
+        cache.get()
+
+    if rendered is None:
+        await _send(send, 404, {'Content-Type': 'text/plain; charset=utf-8'}, b'Not Found')
+        return
+
+    status, response_headers, body = page_cache.respond(
+        rendered, headers.get('accept-encoding'), headers.get('if-none-match')
+    )
+    await _send(send, status, response_headers, body)
+
+
+# sends a whole response at once
+async def _send(send, status, headers, body):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+# sends the pieces of an html page to the browser as soon as each one is ready
+async def _send_html(send, pieces, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/html; charset=utf-8'), *headers],
+    })
+    async for piece in pieces:
+        if piece:
+            await send({'type': 'http.response.body', 'body': piece.encode('utf-8'), 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+# answers the request with the flask app of main.py, in a thread
+async def call_flask(scope, receive, send):
+    body = []
+    while True:
+        message = await receive()
+        body.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+
+    status, headers, content = await run_in_thread(_run_wsgi, _wsgi_environ(scope, b''.join(body)))
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+    await send({'type': 'http.response.body', 'body': content})
+
+
+# the wsgi description of the request (see https://peps.python.org/pep-3333/#environ-variables)
+def _wsgi_environ(scope, body):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = 'HTTP_' + name
+        # a header sent more than once is joined with commas
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+# runs the flask app and returns its (status code, headers, body)
+def _run_wsgi(environ):
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+
+    result = main.app(environ, start_response)
+    try:
+        content = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], content
+
+
+"""
+    the ASGI app, run it with an ASGI server like uvicorn (see the top of this file)
+"""
+async def app(scope, receive, send):
+    global _loop
+
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                _loop = asyncio.get_running_loop()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_http_client.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    if scope['type'] != 'http':
+        return
+    # for servers that don't send the lifespan messages
+    _loop = _loop or asyncio.get_running_loop()
+
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+    is_history_query = 'since' in query or 'limit' in query
+
+    if scope['method'] == 'GET' and scope['path'] in PAGE_ROUTES and not is_history_query:
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        await serve_page(scope['path'], query, headers, send)
+    elif scope['method'] == 'POST' and scope['path'] == '/invalidate':
+        # the caches of this app, not the ones of main.py
+        scrapers_cache.invalidate()
+        generalized_scraper_cache.invalidate()
+        await _send(send, 200, {'Content-Type': 'text/html; charset=utf-8'}, b'ok')
+    else:
+        await call_flask(scope, receive, send)
+
+
+# only start the server when this file is run directly
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, host=HOST, port=PORT)
@@ -0,0 +1,120 @@
+# This file is the asyncio version of http_client.py, used when the app is served with asgi_app.py
+# Instead of a thread waiting on every download, one event loop waits on all of them at once,
+# so hundreds of websites can be downloading at the same time without hundreds of threads
+
+# It takes the same settings as http_client.py (and the same per-site overrides from sites.json),
+# and returns the same http_client.Page, so the rest of the scraping code doesn't care which one was used
+
+# Needs aiohttp: pip install aiohttp (or poetry install -E asgi)
+
+import asyncio
+import random
+from urllib.parse import urlsplit
+
+import aiohttp
+
+import metrics
+from http_client import (
+    CONNECT_TIMEOUT, READ_TIMEOUT, RETRIES, BACKOFF, MAX_BYTES, POOL_SIZE,
+    RETRY_STATUS_CODES, Page, ResponseTooLarge,
+)
+
+
+# one aiohttp session per event loop, its connector keeps up to POOL_SIZE keep-alive connections per host
+# (a session can only be used from the event loop it was made in)
+_sessions = {}
+
+
+def _session_for_current_loop():
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0, limit_per_host=POOL_SIZE))
+        _sessions[loop] = session
+    return session
+
+
+# reads the body of the response, but stops as soon as it gets bigger than max_bytes
+async def _read_capped(response, max_bytes):
+    if response.content_length is not None and response.content_length > max_bytes:
+        raise ResponseTooLarge(f'{response.url} is {response.content_length} bytes (max is {max_bytes})')
+
+    chunks = []
+    size = 0
+    async for chunk in response.content.iter_chunked(64 * 1024):
+        size += len(chunk)
+        if size > max_bytes:
+            raise ResponseTooLarge(f'{response.url} is bigger than {max_bytes} bytes')
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+# the same "full jitter" backoff as http_client, but it only pauses this download, not the whole loop
+async def _sleep_before_retry(attempt, backoff):
+    await asyncio.sleep(random.uniform(0, backoff * (2 ** attempt)))
+
+
+"""
+    downloads the url and returns an http_client.Page
+
+    works exactly like http_client.get: connection errors, timeouts and busy-server status codes
+    (429, 5xx) are retried up to `retries` times, other error status codes raise aiohttp.ClientResponseError
+    headers is an optional dict of extra request headers
+"""
+async def get(
+    url,
+    headers=None,
+    connect_timeout=CONNECT_TIMEOUT,
+    read_timeout=READ_TIMEOUT,
+    retries=RETRIES,
+    backoff=BACKOFF,
+    max_bytes=MAX_BYTES,
+):
+    session = _session_for_current_loop()
+    site = metrics.current_site(default=urlsplit(url).netloc.lower())
+    timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+
+    for attempt in range(retries + 1):
+        is_last_attempt = attempt == retries
+        try:
+            # like in http_client, the connect stage lasts until the response headers have arrived
+            with metrics.timed('connect', site):
+                response = await session.get(url, headers=headers, timeout=timeout)
+
+            async with response:
+                if response.status in RETRY_STATUS_CODES and not is_last_attempt:
+                    metrics.errors.inc(site=site, stage='status')
+                    await _sleep_before_retry(attempt, backoff)
+                    continue
+
+                if response.status >= 400:
+                    metrics.errors.inc(site=site, stage='status')
+                response.raise_for_status()
+
+                with metrics.timed('download', site):
+                    content = await _read_capped(response, max_bytes)
+                metrics.response_bytes.inc(len(content), site=site)
+
+                return Page(str(response.url), response.status, response.headers, content)
+
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if is_last_attempt:
+                raise
+            await _sleep_before_retry(attempt, backoff)
+
+
+"""
+    downloads the url and returns the raw bytes of the page
+    takes the same settings as get()
+"""
+async def fetch(url, **fetch_options):
+    return (await get(url, **fetch_options)).content
+
+
+"""
+    closes the keep-alive connections of the current event loop (e.g. when the server shuts down)
+"""
+async def close():
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
@@ -0,0 +1,89 @@
+# This file is the asyncio version of concurrent_scraping.py, used when the app is served with asgi_app.py
+# Every scraping job is a coroutine instead of a thread, so waiting on hundreds of websites costs
+# one event loop instead of hundreds of threads, and a job that times out is actually stopped
+
+# The work that can't be done without blocking (parsing html, filtering, writing to sqlite) is
+# handed to a thread with run_in_thread, so it never holds up the event loop
+
+# MAX_IN_FLIGHT and SITE_TIMEOUT are the ones set in concurrent_scraping.py
+
+import asyncio
+import contextvars
+import functools
+
+import metrics
+from circuit_breaker import get_breaker
+from concurrent_scraping import skip_open_circuits, MAX_IN_FLIGHT, SITE_TIMEOUT
+
+
+"""
+    runs function(*args, **kwargs) in the event loop's thread pool and returns its result,
+    without blocking the event loop while it runs
+
+    the function sees the same metrics.site_label as the code calling it
+"""
+async def run_in_thread(function, *args, **kwargs):
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        None, functools.partial(context.run, function, *args, **kwargs)
+    )
+
+
+"""
+    works like concurrent_scraping.scrape_concurrently, but each job is an async function
+    (taking no arguments and returning a {"headline": "url"} dictionary)
+
+    it's an async generator, and yields a (name, articles, error) tuple as soon as each job finishes
+    at most max_in_flight jobs run at once, and a job that runs for longer than timeout seconds
+    is cancelled and yielded with a TimeoutError
+"""
+async def scrape_concurrently_async(jobs, max_in_flight=MAX_IN_FLIGHT, timeout=SITE_TIMEOUT, circuit_breakers=True):
+    if circuit_breakers:
+        jobs, skipped_results = skip_open_circuits(jobs)
+        for result in skipped_results:
+            yield result
+
+    if not jobs:
+        return
+
+    slots = asyncio.Semaphore(max_in_flight)
+
+    async def run(name, function):
+        # the timeout only starts once the job has a slot, like in concurrent_scraping
+        async with slots:
+            # everything measured while running this job is labeled with the job's name
+            with metrics.site_label(name):
+                return await asyncio.wait_for(function(), timeout)
+
+    tasks = {asyncio.ensure_future(run(name, function)): name for name, function in jobs}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                name = tasks[task]
+                try:
+                    articles = task.result()
+                    # a scraper that gave up half way shouldn't count as working
+                    if articles is None:
+                        raise ValueError(f'{name} returned no articles')
+                except asyncio.TimeoutError:
+                    metrics.errors.inc(site=name, stage='timeout')
+                    error = TimeoutError(f'{name} took longer than {timeout} seconds')
+                except Exception as scrape_error:
+                    metrics.errors.inc(site=name, stage='scrape')
+                    error = scrape_error
+                else:
+                    if circuit_breakers:
+                        get_breaker(name).record_success(articles)
+                    yield name, articles, None
+                    continue
+
+                if circuit_breakers:
+                    get_breaker(name).record_failure(error)
+                yield name, None, error
+    finally:
+        # stop the jobs nobody is waiting for anymore (e.g. the browser closed the page)
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,29 @@
+# Downloads the current front page of every website we scrape into benchmarks/fixtures,
+# so the benchmarks can run against real html without touching the network afterwards
+# run it from the root of the repository with: python -m benchmarks.record_fixtures
+
+import os
+
+import http_client
+
+FIXTURES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# fixture file name (without .html) -> url of the page it is recorded from
+PAGES = {
+    'bbc': 'https://www.bbc.com/news/science_and_environment',
+    'detroit_news': 'https://www.detroitnews.com/news/',
+    'mlive': 'https://www.mlive.com/',
+}
+
+
+def record_fixtures():
+    os.makedirs(FIXTURES_FOLDER, exist_ok=True)
+    for name, url in PAGES.items():
+        html = http_client.fetch(url)
+        with open(os.path.join(FIXTURES_FOLDER, name + '.html'), 'wb') as file:
+            file.write(html)
+        print(f'recorded {url} ({len(html)} bytes)')
+
+
+if __name__ == '__main__':
+    record_fixtures()
@@ -0,0 +1,321 @@
+# Offline benchmarks for every stage of the pipeline: fetch -> parse -> select -> filter -> render
+# Nothing here touches the network: the http_client is stubbed to return recorded pages from
+# benchmarks/fixtures (see record_fixtures.py), or fake pages from synthetic_pages.py when
+# a site has no recorded page
+
+# run it from the root of the repository with:
+#     python -m benchmarks.run_benchmarks
+# add --full to also filter 1 million headlines, and --json results.json to save the results,
+# then compare two commits with --compare old_results.json
+
+# For every benchmark it reports the throughput (articles or headlines per second),
+# the p50 and p99 latency of a single call, the peak memory used by a single call, and whether
+# it ran on recorded or synthetic pages (numbers from synthetic pages can't be compared with
+# numbers from recorded ones, and the recorded pages aren't in the repository, record them first)
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import http_cache
+import http_client
+import main
+import parse_pool
+from article_store import ArticleStore
+from filter_for_keywords import filter_for_keywords
+from generalized_scraper import scrape_website, extract_articles
+from scraper_registry import load_scrapers
+from site_config import load_sites
+
+from benchmarks.record_fixtures import FIXTURES_FOLDER, PAGES
+from benchmarks.synthetic_pages import make_page, make_headlines
+
+# number of article links on the extra large synthetic page
+LARGE_PAGE_ARTICLES = 5000
+
+
+# which pages each site's benchmarks used, {site: 'recorded' or 'synthetic'}, filled in by load_page
+page_sources = {}
+
+
+# the recorded page of a site if there is one, otherwise a synthetic one
+def load_page(site):
+    path = os.path.join(FIXTURES_FOLDER, site + '.html')
+    if os.path.exists(path):
+        page_sources[site] = 'recorded'
+        with open(path, 'rb') as file:
+            return file.read()
+    page_sources[site] = 'synthetic'
+    return make_page(site)
+
+
+# 'recorded' or 'synthetic' if every one of the sites used that kind of page, otherwise 'mixed'
+def pages_used(sites):
+    sources = {page_sources.get(site, 'synthetic') for site in sites}
+    return sources.pop() if len(sources) == 1 else 'mixed'
+
+
+# says which sites have no recorded page, so nobody mistakes synthetic numbers for real ones
+def warn_about_missing_fixtures():
+    missing = [site for site in PAGES if not os.path.exists(os.path.join(FIXTURES_FOLDER, site + '.html'))]
+    if missing:
+        print(
+            'no recorded page for ' + ', '.join(missing) + ', using synthetic pages instead'
+            ' (record them with: python -m benchmarks.record_fixtures)'
+        )
+
+
+"""
+    replaces http_client.get with a function that returns the given pages ({url: html bytes})
+    instead of downloading them, and turns off the http_cache so every call really parses
+"""
+@contextlib.contextmanager
+def stubbed_fetcher(pages):
+    def fake_get(url, headers=None, **fetch_options):
+        return http_client.Page(url, 200, {}, pages[url])
+
+    original_get = http_client.get
+    original_cache_enabled = http_cache.HTTP_CACHE_ENABLED
+    http_client.get = fake_get
+    http_cache.HTTP_CACHE_ENABLED = False
+    try:
+        yield
+    finally:
+        http_client.get = original_get
+        http_cache.HTTP_CACHE_ENABLED = original_cache_enabled
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[int(round(fraction * (len(sorted_values) - 1)))]
+
+
+"""
+    calls function iterations times and returns the stats of the benchmark
+    function must return the number of items (articles, headlines, ...) it processed
+    pages is what the benchmark ran on ('recorded', 'synthetic' or 'mixed', see pages_used)
+"""
+def measure(name, function, iterations, pages='synthetic'):
+    # scrapers print their errors (and the odd debugging output), which would mess up the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        # one untimed call first, so imports and caches don't count against the first iteration
+        function()
+
+        latencies = []
+        items = 0
+        for _ in range(iterations):
+            start = time.perf_counter()
+            items += function()
+            latencies.append(time.perf_counter() - start)
+
+        # peak memory is measured on a separate call, because tracemalloc slows everything down
+        tracemalloc.start()
+        function()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'name': name,
+        'iterations': iterations,
+        'items_per_second': items / sum(latencies),
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'peak_memory_kib': peak_memory / 1024,
+        'pages': pages,
+    }
+
+
+def benchmark_generalized_scraper(results):
+    websites = {website['name']: website for website in load_sites()}
+    sites = {
+        'BBC Science & Environment': 'bbc',
+        'Detroit News': 'detroit_news',
+        'Mlive': 'mlive',
+    }
+    pages = {websites[name]['url']: load_page(site) for name, site in sites.items()}
+
+    # the bbc markup, but with a lot more articles on the page
+    large_page_url = 'https://example.com/large'
+    pages[large_page_url] = make_page('bbc', LARGE_PAGE_ARTICLES)
+    large_page = dict(websites['BBC Science & Environment'], name='Large synthetic page', url=large_page_url)
+
+    with stubbed_fetcher(pages):
+        for website in list(websites.values()) + [large_page]:
+            def scrape(website=website):
+                return len(scrape_website(
+                    website['url'], website['prefix'], website['link_selector'], website['headline_selector'],
+                    parser=website.get('parser', 'html.parser'),
+                    parse_only=website.get('parse_only', 'links'),
+                ))
+            iterations = 5 if website is large_page else 20
+            pages_source = 'synthetic' if website is large_page else pages_used([sites[website['name']]])
+            results.append(measure('scrape_website: ' + website['name'], scrape, iterations, pages_source))
+
+
+# parses many pages at once through the parse_pool with more and more worker processes,
+# to see how well parsing scales across cpu cores (on a single core it can't get any faster)
+def benchmark_parse_pool(results):
+    if (os.cpu_count() or 1) == 1:
+        print('only 1 cpu core, so the parse_pool numbers can\'t show whether more workers parse faster')
+
+    website = load_sites()[0]
+    parse_args = (website['prefix'], website['link_selector'], website['headline_selector'], website.get('parser', 'html.parser'))
+    pages = [make_page('bbc', seed=seed) for seed in range(16)]
+
+    worker_counts = sorted({1, 2, os.cpu_count() or 1})
+    for workers in worker_counts:
+        def parse_pages(workers=workers):
+            # parse every page at the same time, from threads, like the scrapers do
+            with ThreadPoolExecutor(max_workers=len(pages)) as executor:
+                parsed = executor.map(
+                    lambda html: parse_pool.parse(extract_articles, html, *parse_args, workers=workers), pages,
+                )
+                return sum(len(articles) for articles in parsed)
+        results.append(measure(f'parse_pool: {workers} workers', parse_pages, 5))
+    parse_pool.shutdown()
+
+
+def benchmark_site_scrapers(results):
+    pages = {url: load_page(site) for site, url in PAGES.items()}
+
+    with stubbed_fetcher(pages):
+        for scraper_function in load_scrapers(main.SCRAPERS_FOLDER_NAME, main.SCRAPERS):
+            def scrape(scraper_function=scraper_function):
+                return len(scraper_function() or {})
+            site = scraper_function.__name__[len('scrape_'):]
+            results.append(measure(scraper_function.__name__, scrape, 20, pages_used([site])))
+
+
+def benchmark_filter_for_keywords(results, full):
+    sizes = [10_000, 100_000] + ([1_000_000] if full else [])
+    for size in sizes:
+        articles = {headline: 'https://example.com/' for headline in make_headlines(size)}
+
+        def filter_articles(articles=articles):
+            filter_for_keywords(articles, main.KEYWORDS)
+            return len(articles)
+        results.append(measure(f'filter_for_keywords: {size} titles', filter_articles, 3))
+
+
+# the same headlines as benchmark_filter_for_keywords, scored by a relevance model in numpy batches
+# the model is trained on synthetic headlines labeled by the keywords, which is only good for timing it
+def benchmark_relevance_scorer(results, full):
+    try:
+        import relevance_scorer
+    except ImportError:
+        print('skipping the relevance_scorer benchmark, numpy is not installed')
+        return
+
+    training_headlines = make_headlines(5_000, seed=1)
+    relevant = filter_for_keywords(dict.fromkeys(training_headlines, ''), main.KEYWORDS)
+    labels = relevance_scorer.np.array([float(headline in relevant) for headline in training_headlines])
+    scorer = relevance_scorer.train(training_headlines, labels, epochs=3)
+
+    sizes = [10_000, 100_000] + ([1_000_000] if full else [])
+    for size in sizes:
+        articles = {headline: 'https://example.com/' for headline in make_headlines(size)}
+
+        def filter_articles(articles=articles):
+            scorer.filter(articles)
+            return len(articles)
+        results.append(measure(f'relevance_scorer: {size} titles', filter_articles, 3))
+
+
+def benchmark_main_route(results):
+    pages = {url: load_page(site) for site, url in PAGES.items()}
+    client = main.app.test_client()
+
+    with tempfile.TemporaryDirectory() as folder, stubbed_fetcher(pages):
+        # keep the benchmark's articles out of the real history
+        main._article_store = ArticleStore(os.path.join(folder, 'articles.db'))
+        try:
+            # a page view that has to crawl every site first
+            def cold_page_view():
+                main.scrapers_cache.refresh()
+                client.get('/')
+                return len(main.scrapers_cache.snapshot)
+            results.append(measure('/ (crawl + render)', cold_page_view, 10, pages_used(PAGES)))
+
+            # a page view answered from the article cache
+            def warm_page_view():
+                client.get('/')
+                return len(main.scrapers_cache.snapshot)
+            results.append(measure('/ (from cache)', warm_page_view, 50, pages_used(PAGES)))
+        finally:
+            main._article_store.close()
+            main._article_store = None
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_results(results, previous_results=None):
+    previous = {result['name']: result for result in (previous_results or [])}
+
+    print(f'{"benchmark":<45} {"items/s":>12} {"p50 ms":>9} {"p99 ms":>9} {"peak KiB":>10} {"pages":>10}')
+    for result in results:
+        pages = result.get('pages', 'synthetic')
+        line = (
+            f'{result["name"]:<45} {result["items_per_second"]:>12,.0f} {result["p50_ms"]:>9.2f}'
+            f' {result["p99_ms"]:>9.2f} {result["peak_memory_kib"]:>10,.0f} {pages:>10}'
+        )
+        # how much faster this run is than the compared run (2.00x = twice the throughput)
+        if result['name'] in previous:
+            speedup = result['items_per_second'] / previous[result['name']]['items_per_second']
+            line += f'  {speedup:.2f}x'
+            # older result files don't say, those were most likely synthetic pages too
+            previous_pages = previous[result['name']].get('pages', 'synthetic')
+            if previous_pages != pages:
+                line += f' (compared run used {previous_pages} pages)'
+        print(line)
+
+
+def run_benchmarks(full=False):
+    results = []
+    benchmark_generalized_scraper(results)
+    benchmark_parse_pool(results)
+    benchmark_site_scrapers(results)
+    benchmark_filter_for_keywords(results, full)
+    benchmark_relevance_scorer(results, full)
+    benchmark_main_route(results)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline benchmarks of the scraping pipeline')
+    parser.add_argument('--full', action='store_true', help='also filter 1 million headlines')
+    parser.add_argument('--json', help='save the results into this file')
+    parser.add_argument('--compare', help='results file of an earlier run to compare against')
+    arguments = parser.parse_args()
+
+    warn_about_missing_fixtures()
+    results = run_benchmarks(arguments.full)
+
+    previous_results = None
+    if arguments.compare:
+        with open(arguments.compare) as file:
+            previous_results = json.load(file)['results']
+    print_results(results, previous_results)
+
+    if arguments.json:
+        with open(arguments.json, 'w') as file:
+            json.dump({
+                'commit': current_commit(),
+                'python': platform.python_version(),
+                'cpus': os.cpu_count(),
+                'results': results,
+            }, file, indent=2)
@@ -0,0 +1,82 @@
+# Builds fake news front pages with the same link markup as the real websites, so the
+# benchmarks can run without any network access, and can be scaled up to huge pages
+
+# The pages are generated from a fixed random seed, so every run gets the exact same html
+
+import random
+
+# words the fake headlines are made of, a few of them are in main.KEYWORDS
+HEADLINE_WORDS = (
+    'city council votes on new budget plan for local schools as storm season nears '
+    'polar ice climate change ocean carbon green energy recycling landfill pesticides '
+    'team wins title market falls police report traffic update election results'
+).split()
+
+
+def fake_headline(rng):
+    return ' '.join(rng.choice(HEADLINE_WORDS) for _ in range(rng.randint(5, 12))).capitalize()
+
+
+# the markup of one article link, for each website
+def _bbc_link(rng, number):
+    return (
+        f'<a href="/news/science-environment-{number}" class="gs-c-promo-heading">'
+        f'<h3 class="gs-c-promo-heading__title">{fake_headline(rng)}</h3></a>'
+    )
+
+
+def _detroit_news_link(rng, number):
+    headline = fake_headline(rng)
+    return f'<a href="/story/news/local/{number}/" class="gnt_m_flm_a" data-c-br="{headline}">{headline}</a>'
+
+
+def _mlive_link(rng, number):
+    return f'<a href="https://www.mlive.com/news/{number}.html" data-ga-content-type="article">{fake_headline(rng)}</a>'
+
+
+LINK_MAKERS = {
+    'bbc': _bbc_link,
+    'detroit_news': _detroit_news_link,
+    'mlive': _mlive_link,
+}
+
+
+"""
+    site is 'bbc', 'detroit_news' or 'mlive'
+    article_count is the number of article links on the page
+
+    returns the html of the page as bytes
+    besides the article links, the page has the usual clutter of a news site
+    (scripts, navigation links, images, ...) so parsing it costs about as much as a real page
+"""
+def make_page(site, article_count=300, seed=0):
+    rng = random.Random(seed)
+    make_link = LINK_MAKERS[site]
+
+    parts = ['<!DOCTYPE html><html><head><title>News</title>']
+    parts.extend(f'<script>window.config{i} = {{"a": {i}, "b": [1, 2, 3]}};</script>' for i in range(40))
+    parts.append('<style>.card { margin: 0 }</style></head><body><nav><ul>')
+    parts.extend(f'<li><a href="/section/{i}/">Section {i}</a></li>' for i in range(30))
+    parts.append('</ul></nav><main id="main">')
+
+    for number in range(article_count):
+        parts.append(
+            '<div class="card"><div class="card-meta">'
+            f'<img src="/img/{number}.jpg" alt=""><span class="time">{number} minutes ago</span>'
+            f'<p class="summary">{fake_headline(rng)}. {fake_headline(rng)}.</p></div>'
+        )
+        parts.append(make_link(rng, number))
+        parts.append(f'<a href="/comments/{number}/" class="comments">Comments</a></div>')
+
+    parts.append('</main><footer>')
+    parts.extend(f'<a href="/about/{i}/">About {i}</a>' for i in range(20))
+    parts.append('</footer></body></html>')
+    return ''.join(parts).encode('utf-8')
+
+
+"""
+    returns a list of count fake headlines
+"""
+def make_headlines(count, seed=0):
+    rng = random.Random(seed)
+    return [f'{fake_headline(rng)} {number}' for number in range(count)]
@@ -0,0 +1,169 @@
+# This file keeps track of which websites are broken, so we stop wasting time on them
+# Each website gets a "circuit breaker", which works like the one in your house:
+#   closed     everything is fine, the website is scraped normally
+#   open       the website failed (or timed out) FAILURE_THRESHOLD times in a row, so it is not
+#              scraped at all for COOLDOWN seconds, and its last good articles are used instead
+#   half-open  the cooldown is over, so the website is tried once more; if that works the breaker
+#              closes again, and if it fails the breaker opens again with twice the cooldown
+#              (up to MAX_COOLDOWN), so a website that's down for days is barely tried at all
+
+# number of failures in a row after which a website is skipped
+FAILURE_THRESHOLD = 3
+
+# number of seconds a website is skipped for the first time its breaker opens
+COOLDOWN = 60
+
+# the cooldown doubles every time the website is still broken, up to this many seconds
+MAX_COOLDOWN = 60 * 60
+
+
+#######################################################
+## Configuration Ends Here, Actual Code Begins Below ##
+#######################################################
+
+import threading
+import time
+
+import metrics
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+# the number each state is shown as at /metrics
+_STATE_NUMBERS = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+circuit_state = metrics.Gauge('scraper_circuit_state', 'Circuit breaker state per site (0 closed, 1 half-open, 2 open)')
+
+
+"""
+    raised (well, yielded) instead of scraping a website whose breaker is open
+    and that never had any good articles to use instead
+"""
+class CircuitOpenError(Exception):
+    pass
+
+
+"""
+    the last good {"headline": "url"} articles of a website whose breaker is open, yielded in place of
+    the scrape that was skipped
+    they weren't actually seen on the website again, so the article store, the article window and the
+    crawl scheduler don't count them as a new crawl (filtering them keeps this type, see is_replayed)
+"""
+class ReplayedArticles(dict):
+    pass
+
+
+# whether the articles are the last good articles of a skipped website, rather than a real scrape
+def is_replayed(articles):
+    return isinstance(articles, ReplayedArticles)
+
+
+"""
+    the breaker of one website
+"""
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN, max_cooldown=MAX_COOLDOWN):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self.state = CLOSED
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        # time.time() the breaker last opened, or the half-open probe started
+        self.changed_at = None
+
+        # the articles of the last successful scrape, used while the breaker is open
+        self.last_good_articles = None
+        self.last_success = None
+        self.last_error = None
+
+        self._lock = threading.Lock()
+        circuit_state.set(_STATE_NUMBERS[CLOSED], site=name)
+
+    """
+        returns True if the website should be scraped now
+        (when the breaker is half-open, only one scrape at a time is let through)
+    """
+    def allow_request(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+
+            # an open breaker lets one probe through once the cooldown is over, and a half-open
+            # breaker lets another one through if the last probe was abandoned (e.g. the crawl stopped)
+            if now - self.changed_at >= self.cooldown:
+                self._set_state(HALF_OPEN, now)
+                return True
+            return False
+
+    def record_success(self, articles):
+        with self._lock:
+            self.consecutive_failures = 0
+            self.cooldown = self.base_cooldown
+            self.last_good_articles = articles
+            self.last_success = time.time()
+            self.last_error = None
+            if self.state != CLOSED:
+                self._set_state(CLOSED, None)
+
+    def record_failure(self, error):
+        now = time.time()
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_error = f'{type(error).__name__}: {error}'
+
+            if self.state == HALF_OPEN:
+                # still broken, so wait longer before the next try
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                self._set_state(OPEN, now)
+            elif self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+                self._set_state(OPEN, now)
+
+    """
+        returns a dictionary describing the breaker, for the /health page
+    """
+    def status(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'last_error': self.last_error,
+                'last_success': self.last_success,
+                # when the website will be tried again (None if it isn't being skipped)
+                'retry_at': self.changed_at + self.cooldown if self.state == OPEN else None,
+                'serving_last_good_articles': self.state != CLOSED and self.last_good_articles is not None,
+            }
+
+    # the caller holds the lock
+    def _set_state(self, state, changed_at):
+        self.state = state
+        self.changed_at = changed_at
+        circuit_state.set(_STATE_NUMBERS[state], site=self.name)
+
+
+# the breaker of every website, keyed by website name
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+"""
+    returns the breaker of the website with that name, making it the first time
+"""
+def get_breaker(name):
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+"""
+    returns {"website name": breaker status dictionary} of every website seen so far
+"""
+def all_statuses():
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.status() for breaker in breakers}
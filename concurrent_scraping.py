@@ -0,0 +1,143 @@
+# This file runs many scraping jobs at the same time instead of one after another
+# Both main.get_articles and generalized_scraper.get_articles use it, so that the time
+# it takes to scrape every site is close to the time of the slowest site, rather than
+# the sum of every site added together
+
+# Every site also has a circuit breaker (see circuit_breaker.py): a site that keeps failing
+# is skipped for a while, and its last good articles are yielded instead of scraping it
+
+# maximum number of sites that will be scraped at the same time
+# a site spends almost all its time waiting on the network, so this is set high enough for every site of
+# a crawl with up to 64 sites to run at once, which keeps the crawl about as long as the slowest site
+# (with fewer than this, the crawl takes roughly number of sites / MAX_IN_FLIGHT times the slowest site)
+# each site in flight is a thread, and sites on the same host are still limited by http_client.POOL_SIZE
+MAX_IN_FLIGHT = 64
+
+# number of seconds a single site is allowed to take before we give up waiting on it
+SITE_TIMEOUT = 15
+
+
+#######################################################
+## Configuration Ends Here, Actual Code Begins Below ##
+#######################################################
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import metrics
+from circuit_breaker import get_breaker, CircuitOpenError, ReplayedArticles
+
+
+"""
+    takes in a list of (name, function) pairs, where each function takes no
+    arguments and returns a {"headline": "url"} dictionary for one website
+
+    scrape_concurrently is a generator, and it yields a (name, articles, error)
+    tuple as soon as each job finishes. articles is None if the job failed,
+    and error is None if the job succeeded
+
+    at most max_in_flight jobs run at once, and a job that has been running
+    for longer than timeout seconds is given up on and yielded with a TimeoutError
+    (the thread itself can't be killed, but nobody waits on it anymore)
+
+    if circuit_breakers is True, a job whose site's breaker is open isn't run: its last good
+    articles are yielded right away instead (or a CircuitOpenError if it never had any)
+"""
+def scrape_concurrently(jobs, max_in_flight=MAX_IN_FLIGHT, timeout=SITE_TIMEOUT, circuit_breakers=True):
+    if circuit_breakers:
+        jobs, skipped_results = skip_open_circuits(jobs)
+        yield from skipped_results
+
+    if not jobs:
+        return
+
+    # the time.monotonic() at which each job actually started running
+    # jobs that are still queued behind max_in_flight won't have an entry yet
+    start_times = {}
+
+    def run(job_id, name, function):
+        start_times[job_id] = time.monotonic()
+        # everything measured while running this job is labeled with the job's name
+        with metrics.site_label(name):
+            return function()
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_in_flight, len(jobs))))
+    futures = {}
+    for job_id, (name, function) in enumerate(jobs):
+        futures[executor.submit(run, job_id, name, function)] = (job_id, name)
+
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = wait(
+                pending,
+                timeout=_time_until_next_deadline(pending, futures, start_times, timeout),
+                return_when=FIRST_COMPLETED,
+            )
+
+            for future in done:
+                name = futures[future][1]
+                try:
+                    articles = future.result()
+                    # a scraper that gave up half way shouldn't count as working
+                    if articles is None:
+                        raise ValueError(f'{name} returned no articles')
+                except Exception as error:
+                    metrics.errors.inc(site=name, stage='scrape')
+                    if circuit_breakers:
+                        get_breaker(name).record_failure(error)
+                    yield name, None, error
+                else:
+                    if circuit_breakers:
+                        get_breaker(name).record_success(articles)
+                    yield name, articles, None
+
+            # give up on any job that has been running for too long
+            now = time.monotonic()
+            for future in list(pending):
+                job_id, name = futures[future]
+                started = start_times.get(job_id)
+                if started is not None and now - started > timeout:
+                    pending.discard(future)
+                    metrics.errors.inc(site=name, stage='timeout')
+                    error = TimeoutError(f'{name} took longer than {timeout} seconds')
+                    if circuit_breakers:
+                        get_breaker(name).record_failure(error)
+                    yield name, None, error
+    finally:
+        # don't start any jobs that are still queued, and don't wait
+        # for the ones that timed out to finish
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+"""
+    splits the jobs into the ones whose breaker lets them run, and the (name, articles, error)
+    results to yield right away for the others (their last good articles, or a CircuitOpenError)
+    also used by async_scraping.py
+"""
+def skip_open_circuits(jobs):
+    allowed_jobs = []
+    skipped_results = []
+    for name, function in jobs:
+        breaker = get_breaker(name)
+        if breaker.allow_request():
+            allowed_jobs.append((name, function))
+        elif breaker.last_good_articles is None:
+            skipped_results.append((name, None, CircuitOpenError(f'{name} is skipped after failing too often')))
+        else:
+            skipped_results.append((name, ReplayedArticles(breaker.last_good_articles), None))
+    return allowed_jobs, skipped_results
+
+
+# how long wait() should block before we need to check the deadlines again
+def _time_until_next_deadline(pending, futures, start_times, timeout):
+    now = time.monotonic()
+    remaining = timeout
+    for future in pending:
+        started = start_times.get(futures[future][0])
+        if started is not None:
+            remaining = min(remaining, started + timeout - now)
+    # never busy-loop, even if a deadline has just passed
+    return max(remaining, 0.05)
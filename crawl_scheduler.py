@@ -0,0 +1,291 @@
+# This file decides when each site gets crawled again, instead of crawling every site at the same moment
+# Every site has its own crawl interval, which adapts to how often the site actually changes:
+#   - if a crawl finds a different set of articles than the last one, the interval shrinks
+#   - if a crawl finds exactly the same articles, the interval grows
+# so our requests go to the sites where new articles actually show up
+
+# the shortest and longest time (in seconds) between two crawls of the same site
+MIN_INTERVAL = 60
+MAX_INTERVAL = 60 * 60
+
+# the interval every site starts with
+START_INTERVAL = 5 * 60
+
+# the interval is multiplied by this when the site changed, and by SLOWDOWN when it didn't
+SPEEDUP = 0.5
+SLOWDOWN = 1.5
+
+# every interval is randomly made up to this fraction longer or shorter, so that sites
+# that started together don't stay in lockstep and all get crawled at the same moment
+JITTER = 0.1
+
+# how many sites on the same host can be crawled at the same time
+PER_HOST_LIMIT = 2
+
+# how many sites can be crawled at the same time in total
+MAX_IN_FLIGHT = 8
+
+
+#######################################################
+## Configuration Ends Here, Actual Code Begins Below ##
+#######################################################
+
+import heapq
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from article_record import ArticleWindow
+from circuit_breaker import is_replayed
+
+
+class SiteSchedule:
+    def __init__(self, name, host, function):
+        self.name = name
+        self.host = host
+        self.function = function
+
+        self.interval = START_INTERVAL
+        # time.monotonic() at which the site should be crawled next
+        self.next_crawl = 0.0
+
+        # a fingerprint of the articles of the last successful crawl, to tell whether the next one
+        # found anything different, None until there is one (the articles themselves are in the window)
+        self.fingerprint = None
+        self.running = False
+        self.crawls = 0
+        self.changes = 0
+        # set when the site is taken out of the scheduler by set_jobs
+        self.removed = False
+
+
+"""
+    jobs is a list of (name, host, function) tuples, one per site
+    function crawls the site, and returns its {"headline": "url"} dictionary (or None if the crawl failed)
+
+    the articles of every crawl go into window (an article_record.ArticleWindow, a new one if it isn't given)
+    on_update is called with an article_record.ArticleSnapshot of the window each time a crawl finds a change
+"""
+class CrawlScheduler:
+    def __init__(
+        self, jobs, on_update=None,
+        min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL,
+        per_host_limit=PER_HOST_LIMIT, max_in_flight=MAX_IN_FLIGHT, window=None,
+    ):
+        self.sites = [SiteSchedule(name, host, function) for name, host, function in jobs]
+        self.on_update = on_update
+        self.window = ArticleWindow() if window is None else window
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.per_host_limit = per_host_limit
+
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._lock = threading.Lock()
+        # sites waiting for their next crawl, as a heap of (next_crawl, position in self.sites)
+        # the first crawl of every site is done by crawl_all(), so nothing is queued yet
+        # entries whose time doesn't match their site's next_crawl anymore are outdated, and skipped
+        self._queue = []
+        # number of crawls currently running on each host
+        self._running_per_host = {}
+        self._wake_up = threading.Event()
+        self._thread = None
+
+        # the positions of the sites crawl_all() is still waiting for, and how it gets told they're done
+        self._full_crawl_waiting = set()
+        self._full_crawl_done = threading.Event()
+
+    """
+        starts crawling in a background thread (does nothing if it's already started)
+    """
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run_forever, daemon=True)
+                self._thread.start()
+
+    """
+        crawls every site right now (still respecting the per-host limit), and
+        waits for them to be done, but no longer than timeout seconds
+
+        returns an article_record.ArticleSnapshot of the articles of every site
+        this is also how the very first crawl of every site is done
+    """
+    def crawl_all(self, timeout=60):
+        self.start()
+        with self._lock:
+            now = time.monotonic()
+            self._full_crawl_done.clear()
+            self._full_crawl_waiting = {position for position, site in enumerate(self.sites) if not site.removed}
+            for position in self._full_crawl_waiting:
+                self.sites[position].next_crawl = now
+                heapq.heappush(self._queue, (now, position))
+            if not self._full_crawl_waiting:
+                self._full_crawl_done.set()
+
+        self._wake_up.set()
+        self._full_crawl_done.wait(timeout)
+        return self.snapshot()
+
+    """
+        starts crawling in the background, without crawling every site right now like crawl_all()
+        each site that isn't scheduled yet is crawled for the first time once its interval has passed
+        (for when every site was just crawled some other way, e.g. by a streamed page view)
+    """
+    def schedule_all(self):
+        self.start()
+        with self._lock:
+            now = time.monotonic()
+            for position, site in enumerate(self.sites):
+                # next_crawl is only 0 for sites that were never queued
+                if site.removed or site.running or site.next_crawl:
+                    continue
+                site.next_crawl = now + site.interval * random.uniform(1 - JITTER, 1 + JITTER)
+                heapq.heappush(self._queue, (site.next_crawl, position))
+
+        self._wake_up.set()
+
+    """
+        changes the sites to jobs (the same kind of list the scheduler was made with)
+        sites that are already scheduled keep their schedule, but use the new function and host,
+        new sites are crawled right away, and sites that aren't in jobs anymore are dropped
+    """
+    def set_jobs(self, jobs):
+        with self._lock:
+            now = time.monotonic()
+            sites_by_name = {site.name: site for site in self.sites if not site.removed}
+            job_names = set()
+            for name, host, function in jobs:
+                job_names.add(name)
+                site = sites_by_name.get(name)
+                if site is not None:
+                    site.host = host
+                    site.function = function
+                    continue
+
+                # positions in the queue are positions in self.sites, so new sites go at the end
+                site = SiteSchedule(name, host, function)
+                site.next_crawl = now
+                self.sites.append(site)
+                heapq.heappush(self._queue, (now, len(self.sites) - 1))
+
+            for name, site in sites_by_name.items():
+                if name not in job_names:
+                    site.removed = True
+                    site.fingerprint = None
+                    self.window.remove_source(name)
+
+        self._wake_up.set()
+
+    """
+        returns an article_record.ArticleSnapshot of the articles of every site
+        (the articles of the last crawl of every site, and the ones from earlier crawls that are still in the window)
+    """
+    def snapshot(self):
+        return self.window.snapshot()
+
+    """
+        returns how each site is currently scheduled, e.g. to show it to the operators
+    """
+    def stats(self):
+        now = time.monotonic()
+        return [
+            {
+                'name': site.name,
+                'host': site.host,
+                'interval': site.interval,
+                'next_crawl_in': max(0.0, site.next_crawl - now),
+                'crawls': site.crawls,
+                'changes': site.changes,
+            }
+            for site in self.sites
+            if not site.removed
+        ]
+
+    def _run_forever(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                postponed = []
+                while self._queue and self._queue[0][0] <= now:
+                    crawl_time, position = heapq.heappop(self._queue)
+                    site = self.sites[position]
+
+                    # the site was rescheduled since this entry was queued, or it's being crawled right now
+                    # (it gets rescheduled when that crawl is done), or it was taken out by set_jobs
+                    if crawl_time != site.next_crawl or site.running or site.removed:
+                        continue
+
+                    # this host is already being crawled as much as we allow, try again a bit later
+                    if self._running_per_host.get(site.host, 0) >= self.per_host_limit:
+                        site.next_crawl = now + 1
+                        postponed.append((site.next_crawl, position))
+                        continue
+
+                    site.running = True
+                    self._running_per_host[site.host] = self._running_per_host.get(site.host, 0) + 1
+                    self._executor.submit(self._crawl, site, position)
+
+                for item in postponed:
+                    heapq.heappush(self._queue, item)
+
+                wait_time = self._queue[0][0] - now if self._queue else None
+
+            # sleep until the next site is due, or until a crawl finishes and reschedules its site
+            self._wake_up.wait(timeout=wait_time)
+            self._wake_up.clear()
+
+    def _crawl(self, site, position):
+        try:
+            with metrics.site_label(site.name):
+                articles = site.function()
+        except Exception as error:
+            print('Something went wrong with: ' + site.name)
+            print('The error is:')
+            print(error)
+            articles = None
+
+        # the last good articles of a website whose circuit breaker is open weren't actually crawled,
+        # so they count like a failed crawl (see circuit_breaker.ReplayedArticles)
+        if is_replayed(articles):
+            articles = None
+
+        changed = False
+        with self._lock:
+            site.running = False
+            self._running_per_host[site.host] -= 1
+
+            fingerprint = None if articles is None else hash(frozenset(articles.items()))
+            # the very first crawl of a site can't tell us anything about how often it changes
+            if articles is not None and site.fingerprint is None:
+                site.crawls += 1
+                changed = True
+            elif articles is not None:
+                site.crawls += 1
+                changed = fingerprint != site.fingerprint
+                if changed:
+                    site.changes += 1
+                    site.interval = max(self.min_interval, site.interval * SPEEDUP)
+                else:
+                    site.interval = min(self.max_interval, site.interval * SLOWDOWN)
+
+            if articles is not None and not site.removed:
+                site.fingerprint = fingerprint
+                # an unchanged crawl still marks its articles as seen, so they stay in the window
+                self.window.update(site.name, articles)
+            metrics.crawl_interval.set(site.interval, site=site.name)
+
+            # a failed crawl keeps the same interval, and the last good articles are kept
+            interval = site.interval * random.uniform(1 - JITTER, 1 + JITTER)
+            site.next_crawl = time.monotonic() + interval
+            heapq.heappush(self._queue, (site.next_crawl, position))
+
+            self._full_crawl_waiting.discard(position)
+            if not self._full_crawl_waiting:
+                self._full_crawl_done.set()
+
+        self._wake_up.set()
+
+        if changed and self.on_update is not None:
+            self.on_update(self.snapshot())
@@ -0,0 +1,179 @@
+# This file groups headlines that are about the same story, even when each website words it
+# slightly differently (like the same wire story on BBC, Detroit News and Mlive), so the page
+# only shows one of them, with the urls of the others next to it
+
+# Comparing every headline with every other headline gets slow very quickly, so instead:
+#   1. each headline is cut into overlapping pieces of SHINGLE_SIZE characters ("shingles")
+#   2. a MinHash signature of NUM_HASHES numbers is made from the shingles; two headlines share
+#      about as many signature numbers as they share shingles
+#   3. the signature is split into BANDS bands, and only headlines that have at least one whole
+#      band in common (locality-sensitive hashing) are compared at all
+# New headlines are added one at a time, and the clusters that already exist are never recomputed
+
+# how many characters are in each shingle
+SHINGLE_SIZE = 4
+
+# length of the MinHash signatures, must be a multiple of BANDS
+# with 20 bands of 3, headlines that share half their shingles are compared 93% of the time,
+# and headlines that share 5% of them only 0.25% of the time
+NUM_HASHES = 60
+BANDS = 20
+
+# two headlines are the same story if at least this fraction of their shingles are the same
+SIMILARITY_THRESHOLD = 0.5
+
+# the oldest headlines are forgotten once more than this many are remembered
+MAX_HEADLINES = 50000
+
+
+#######################################################
+## Configuration Ends Here, Actual Code Begins Below ##
+#######################################################
+
+import random
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+# a prime bigger than any shingle hash, for the (a * x + b) % prime hash functions
+_PRIME = (1 << 61) - 1
+
+# the NUM_HASHES hash functions, from a fixed seed so signatures are the same in every run
+_random = random.Random(1)
+_HASH_FUNCTIONS = [
+    (_random.randrange(1, _PRIME), _random.randrange(0, _PRIME)) for _ in range(NUM_HASHES)
+]
+
+
+def _shingles(headline):
+    # lowercase, and turn punctuation and runs of whitespace into single spaces
+    text = ' '.join(re.sub(r'[^\w]+', ' ', headline.lower()).split())
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[start:start + SHINGLE_SIZE] for start in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash_signature(headline):
+    hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in _shingles(headline)]
+    # (list comprehensions instead of generators, they're noticeably faster here)
+    return tuple([min([(a * value + b) % _PRIME for value in hashes]) for a, b in _HASH_FUNCTIONS])
+
+
+def _bands(signature):
+    rows = NUM_HASHES // BANDS
+    return [(band, signature[band * rows:(band + 1) * rows]) for band in range(BANDS)]
+
+
+def _similarity(signature, other_signature):
+    return sum(1 for a, b in zip(signature, other_signature) if a == b) / NUM_HASHES
+
+
+class Cluster:
+    def __init__(self, headline, url):
+        # the first headline of the story we saw is the one that gets shown
+        self.headline = headline
+        self.url = url
+        # every other (headline, url) of the same story
+        self.siblings = []
+
+
+"""
+    remembers every headline it's given, and which story (cluster) it belongs to
+    it can be shared between threads (the crawl threads and the page views)
+"""
+class HeadlineClusterer:
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, max_headlines=MAX_HEADLINES):
+        self.threshold = threshold
+        self.max_headlines = max_headlines
+
+        # url -> (signature, cluster) of every remembered headline, oldest first
+        self._headlines = OrderedDict()
+        # (band number, band values) -> urls of the headlines with that band
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    """
+        adds a headline, and returns the Cluster it belongs to
+        adding a url that was already added does nothing
+    """
+    def add(self, headline, url):
+        with self._lock:
+            return self._add(headline, url)
+
+    def _add(self, headline, url):
+        # the clusters are kept for a long time, so they shouldn't point into a bs4 parse tree
+        headline = str(headline)
+        url = str(url)
+        known = self._headlines.get(url)
+        if known is not None:
+            return known[1]
+
+        signature = minhash_signature(headline)
+        bands = _bands(signature)
+
+        # only the headlines sharing a band are compared
+        candidates = set()
+        for band in bands:
+            candidates.update(self._buckets.get(band, ()))
+
+        best_cluster = None
+        best_similarity = self.threshold
+        for other_url in candidates:
+            other_signature, other_cluster = self._headlines[other_url]
+            similarity = _similarity(signature, other_signature)
+            if similarity >= best_similarity:
+                best_cluster, best_similarity = other_cluster, similarity
+
+        if best_cluster is None:
+            cluster = Cluster(headline, url)
+        else:
+            cluster = best_cluster
+            cluster.siblings.append((headline, url))
+
+        self._headlines[url] = (signature, cluster)
+        for band in bands:
+            self._buckets.setdefault(band, []).append(url)
+
+        while len(self._headlines) > self.max_headlines:
+            self._forget_oldest()
+
+        return cluster
+
+    """
+        articles is a {"headline": "url"} dictionary
+
+        returns a new {"headline": "url"} dictionary with only one article per story
+        (the first one of that story that was ever added)
+    """
+    def deduplicate(self, articles):
+        representatives = {}
+        shown_clusters = set()
+        for headline, url in articles.items():
+            cluster = self.add(headline, url)
+            if id(cluster) not in shown_clusters:
+                shown_clusters.add(id(cluster))
+                representatives[cluster.headline] = cluster.url
+        return representatives
+
+    """
+        returns the urls of the other articles of the same story as url
+    """
+    def siblings(self, url):
+        with self._lock:
+            known = self._headlines.get(url)
+            if known is None:
+                return []
+            cluster = known[1]
+            all_urls = [cluster.url] + [sibling_url for _, sibling_url in cluster.siblings]
+        return [other_url for other_url in all_urls if other_url != url]
+
+    def _forget_oldest(self):
+        url, (signature, _) = self._headlines.popitem(last=False)
+        for band in _bands(signature):
+            bucket = self._buckets.get(band)
+            if bucket is None:
+                continue
+            bucket.remove(url)
+            if not bucket:
+                del self._buckets[band]
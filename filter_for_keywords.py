@@ -1,3 +1,8 @@
+import re
+from functools import lru_cache
+
+import metrics
+
 # currently this only lowercases the title
 # so stuff like "polar" and "Polar" match
 # but other stuff like removing whitespace
@@ -7,36 +12,180 @@ def normalize(title):
 
 
 """
-articles is a { dictionary } of {"article title": "article url"}
 keywords is a [ list ] of keywords
 
+KeywordMatcher compiles every keyword into one single regular expression, so each title
+is scanned once, instead of once per keyword. Compile it once and reuse it across calls.
+
+if word_boundaries is True, keywords only match whole words, so short keywords
+like 'ber', 'nss' or 'acid' don't match inside unrelated words like 'number' or 'placid'
+"""
+class KeywordMatcher:
+    def __init__(self, keywords, word_boundaries=False):
+        # normalize every keyword only one time, here, instead of once per title
+        # dict.fromkeys removes duplicate keywords while keeping their order
+        self.keywords = list(dict.fromkeys(normalize(keyword) for keyword in keywords))
+        self.word_boundaries = word_boundaries
+
+        # (?!) never matches anything, so an empty keyword list matches no titles
+        pattern = _trie_regex(self.keywords) or '(?!)'
+        if word_boundaries:
+            # not \b, which never matches after a keyword ending in something like ')' when a space follows
+            pattern = r'(?<!\w)(?:' + pattern + r')(?!\w)'
+        self._pattern = re.compile(pattern)
+
+        # the lookahead lets finditer find a match starting at every position,
+        # even when the matches overlap (like "greenhouse effect" and "house")
+        self._overlapping_pattern = re.compile('(?=(' + pattern + '))')
+
+        # the regex only reports the longest keyword starting at each position, so
+        # remember which shorter keywords are hidden inside each keyword
+        # e.g. "climate change" also contains "climate"
+        self._contained_keywords = {
+            keyword: {
+                other for other in self.keywords
+                if self._contains(keyword, other)
+            }
+            for keyword in self.keywords
+        }
+
+    """
+        returns True if the title contains at least 1 of the keywords
+    """
+    def matches(self, title):
+        return self._pattern.search(normalize(title)) is not None
+
+    """
+        returns the set of every keyword found in the title
+    """
+    def find_all(self, title):
+        matched_keywords = set()
+        for match in self._overlapping_pattern.finditer(normalize(title)):
+            matched_keywords.update(self._contained_keywords[match.group(1)])
+        return matched_keywords
+
+    """
+        returns the set of keywords found in the title, without the shorter keywords hidden inside
+        them (so "climate change" doesn't also count as "climate")
+    """
+    def find_longest(self, title):
+        return set(self._pattern.findall(normalize(title)))
+
+    def _contains(self, keyword, other):
+        if not self.word_boundaries:
+            return other in keyword
+        return re.search(r'(?<!\w)' + re.escape(other) + r'(?!\w)', keyword) is not None
+
+
+# builds a regular expression that matches any of the words, shaped like a trie
+# e.g. ["acid", "air pollution", "air quality"] becomes "a(?:cid|ir\ (?:pollution|quality))"
+# python's re module tries the alternatives of a plain "acid|air pollution|..." one by one at
+# every position of the title, but the trie shape lets it rule most of them out after one character
+def _trie_regex(words):
+    trie = {}
+    for word in words:
+        node = trie
+        for character in word:
+            node = node.setdefault(character, {})
+        # '' marks that a word ends at this node
+        node[''] = {}
+
+    return _render_trie(trie)
+
+
+def _render_trie(node):
+    alternatives = [
+        re.escape(character) + _render_trie(child)
+        for character, child in sorted(node.items())
+        if character != ''
+    ]
+    if not alternatives:
+        return ''
+
+    if len(alternatives) == 1:
+        pattern = alternatives[0]
+    else:
+        pattern = '(?:' + '|'.join(alternatives) + ')'
+
+    # a word ends here, but longer words continue, so the continuation is optional
+    # (optional groups are greedy, so the longest keyword is still preferred)
+    if '' in node:
+        pattern = '(?:' + pattern + ')?'
+    return pattern
+
+
+# compiling the matcher is the slow part, so reuse the compiled matcher
+# whenever filter_for_keywords is called with the same keywords again
+@lru_cache(maxsize=32)
+def _compile_matcher(keywords, word_boundaries):
+    return KeywordMatcher(keywords, word_boundaries)
+
+
+def get_matcher(keywords, word_boundaries=False):
+    # an already compiled matcher can be passed in place of the keywords list
+    if isinstance(keywords, KeywordMatcher):
+        return keywords
+    return _compile_matcher(tuple(keywords), word_boundaries)
+
+
+"""
+articles is a { dictionary } of {"article title": "article url"}
+keywords is a [ list ] of keywords (or an already compiled KeywordMatcher)
+
 filter_for_keywords will return a new dictionary which only contains the articles
 whose titles contain at least 1 of the keywords
 """
-def filter_for_keywords(articles, keywords):
-    # make an empty dictionary, which we will return at the end
-    filtered_articles = {}
-    
-    for title, url in articles.items():
-        # normalize ensures that two strings are in the same format
-        # currently it only lowercases, them but it could be expanded to do more
-        # like removing whitespace, etc...
-        # this function is needed so stuff like "polar" and "Polar" match
-
-        # normalize the title outside of the loop so its only done one time, and not once per keyword
-        normalized_title = normalize(title)
-
-        for keyword in keywords:
-            # if keyword not in title, then try again with the next keyword
-            if normalize(keyword) not in normalized_title:
-                continue
-
-            # if the code reaches here, then there was a successful keyword/title match
-            # so add the title,url pair to the filtered dictionary
-            # make sure to use the actual title and not the normalized version
-            filtered_articles[title] = url
-
-            # exit the loop early, no need to continue and go over every other keyword remaining
-            break
-    
-    return filtered_articles
\ No newline at end of file
+def filter_for_keywords(articles, keywords, word_boundaries=False):
+    matcher = get_matcher(keywords, word_boundaries)
+
+    # make sure to use the actual title and not the normalized version
+    with metrics.timed('filter'):
+        return {title: url for title, url in articles.items() if matcher.matches(title)}
+
+
+"""
+same as filter_for_keywords, but returns {"article title": {matched keywords}}
+so you can see every keyword that caused each article to be kept
+"""
+def match_keywords(articles, keywords, word_boundaries=False):
+    matcher = get_matcher(keywords, word_boundaries)
+
+    matched_keywords = {}
+    for title in articles:
+        found = matcher.find_all(title)
+        if found:
+            matched_keywords[title] = found
+    return matched_keywords
+
+
+# the ways filter_relevant can decide which articles to keep
+RELEVANCE_MODES = ('keywords', 'model', 'either', 'both')
+
+"""
+same as filter_for_keywords, but mode picks how relevance is decided:
+    'keywords'  articles whose titles contain at least 1 of the keywords
+    'model'     articles the trained model of relevance_scorer.py scores high enough
+    'either'    articles kept by the keywords or by the model
+    'both'      articles kept by the keywords and by the model
+"""
+def filter_relevant(articles, keywords, mode='keywords'):
+    if mode not in RELEVANCE_MODES:
+        raise ValueError(f'unknown relevance mode {mode!r}, expected one of {RELEVANCE_MODES}')
+
+    if mode == 'keywords':
+        return filter_for_keywords(articles, keywords)
+
+    # only imported when the model is actually used, because it needs numpy
+    from relevance_scorer import filter_for_relevance
+
+    kept_by_model = filter_for_relevance(articles)
+    if mode == 'model':
+        return kept_by_model
+
+    # match the keywords while building the result, instead of making a dictionary of the keyword matches first
+    matcher = get_matcher(keywords)
+    with metrics.timed('filter'):
+        # keep the original article order
+        if mode == 'either':
+            return {title: url for title, url in articles.items() if title in kept_by_model or matcher.matches(title)}
+        return {title: url for title, url in kept_by_model.items() if matcher.matches(title)}
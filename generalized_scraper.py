@@ -2,7 +2,7 @@
 # You can scrape essentially every news site in existence without writing a line of python
 
 # if you want to scrape an unadded news site, simply add a dictionary with the
-# neccessary keys to the scraper_inputs list below
+# neccessary keys to the list in sites.json (see site_config.py, which checks and loads it)
 # then run this file with: python3 generalized_scraper.py
 # to get a dictionary of articles across every scraped site in the form {"headline": "url"}
 
@@ -11,7 +11,7 @@
 # is enough to guide the generalized scraper through essentially any news site in existence
 
 '''
-    This is a list of websites to scrape. Each website is represented as a dictionary
+    sites.json is a list of websites to scrape. Each website is represented as a dictionary
     containing a human-readable 'name', the 'url' to access the website, a 'link_selector'
     and a 'headline_selector', and a 'prefix'.
 
@@ -43,92 +43,165 @@
     'a[href ^= "/news"] h3', aka any <h3> tag that is the child of an <a> tag whose href 
     property starts with /news.
 
-    For the selectors, please wrap the string with single-quotes ('') as much as possible 
-    because the acutal css selectors heavily use double-quotes ("").
+    sites.json is a json file, so the double-quotes ("") inside the css selectors have to be
+    written as \" (e.g. "a[href ^= \"/news\"]"), and None is written as null.
+
+    Optionally, a website can also override how its html is downloaded, by adding any of
+    the keys 'connect_timeout', 'read_timeout', 'retries', 'backoff' or 'max_bytes'.
+    See http_client.py for what they do and their default values.
+
+    A website can also choose how its html is parsed, which is usually the slowest part:
+    'parser' picks the BeautifulSoup parser backend ('html.parser', 'lxml' or 'html5lib'),
+    and 'parse_only' picks how much of the page is turned into a tree. 'parse_only' is
+    'links' by default, which only parses the tags that 'link_selector' can match (this is
+    skipped automatically when 'link_selector' depends on the rest of the page, like
+    'div.stories a'). It can also be a simple container selector like 'main' or
+    'div#content' to only parse that part of the page, or None to parse the whole page.
+    See html_parsing.py for more details.
 '''
-scraper_inputs = [
-    {
-        'name': 'BBC Science & Environment',
-        'url': 'https://www.bbc.com/news/science_and_environment',
-        'prefix': 'https://bbc.com',
-        'link_selector': 'a[href ^= "/news"].gs-c-promo-heading',
-        'headline_selector': 'h3',
-    },
-    {
-        'name': 'Detroit News',
-        'url': 'https://www.detroitnews.com/news/',
-        'prefix': 'https://www.detroitnews.com/story',
-        'link_selector': 'a.gnt_m_flm_a',
-        'headline_selector': None,
-    },
-    {
-        'name': 'Mlive',
-        'url': 'https://www.mlive.com/',
-        'prefix': '',
-        'link_selector': 'a[data-ga-content-type = "article"]',
-        'headline_selector': None,
-    },
-]
 
 
 #######################################################
 ## Configuration Ends Here, Actual Code Begins Below ##
 #######################################################
 
-import requests
-from bs4 import BeautifulSoup
-import sys
+import http_client
+import http_cache
+import metrics
+from async_scraping import scrape_concurrently_async, run_in_thread
+from circuit_breaker import ReplayedArticles, is_replayed
+from concurrent_scraping import scrape_concurrently, MAX_IN_FLIGHT, SITE_TIMEOUT
+from filter_for_keywords import filter_relevant
+from html_parsing import make_soup, compile_selector, strainer_for_selector, strainer_for_container, DEFAULT_PARSER
+from site_config import load_sites
+
+
+"""
+    takes in strings (and an optional dict of http_client settings, like read_timeout or retries,
+    and the optional parser and parse_only settings described at the top of this file)
+
+    returns a dictionary where each key is an article headline
+    pointing to the url of that article
+    {"headline": "url"}
+
+    if the page hasn't changed since the last crawl, the result of the last crawl is
+    reused without downloading or parsing the page again (see http_cache.py)
+"""
+def scrape_website(
+    url, prefix, link_selector, headline_selector,
+    fetch_options=None, parser=DEFAULT_PARSER, parse_only='links',
+):
+    return http_cache.scrape_cached(
+        url,
+        extract_articles,
+        parse_args=(prefix, link_selector, headline_selector, parser, parse_only),
+        # the cached articles are only valid for these exact selectors, prefix and parser
+        parse_key='\n'.join([prefix, link_selector, str(headline_selector), parser]),
+        fetch_options=fetch_options,
+    )
+
+
+"""
+    same as scrape_website, but for asgi_app.py: the page is downloaded without blocking
+    the event loop, and parsed in a thread (see http_cache.scrape_cached_async)
+"""
+async def scrape_website_async(
+    url, prefix, link_selector, headline_selector,
+    fetch_options=None, parser=DEFAULT_PARSER, parse_only='links',
+):
+    return await http_cache.scrape_cached_async(
+        url,
+        extract_articles,
+        parse_args=(prefix, link_selector, headline_selector, parser, parse_only),
+        parse_key='\n'.join([prefix, link_selector, str(headline_selector), parser]),
+        fetch_options=fetch_options,
+    )
+
+
+# the arguments of scrape_website (and scrape_website_async) for a website from sites.json
+def _scrape_arguments(website):
+    return dict(
+        url=website['url'],
+        prefix=website['prefix'],
+        link_selector=website['link_selector'],
+        headline_selector=website['headline_selector'],
+        fetch_options=http_client.fetch_options_for(website),
+        parser=website.get('parser', DEFAULT_PARSER),
+        parse_only=website.get('parse_only', 'links'),
+    )
 
 
 """
-    takes in strings
+    takes in the raw html of a website, and the same strings as scrape_website
 
     returns a dictionary where each key is an article headline
     pointing to the url of that article
     {"headline": "url"}
 """
-def scrape_website(url, prefix, link_selector, headline_selector):
+def extract_articles(
+    html, prefix, link_selector, headline_selector,
+    parser=DEFAULT_PARSER, parse_only='links',
+):
     # create an empty dict to put stuff into
     # will look like {"headline" : "link"}
     # this will only include articles from a single website
     website_articles = {}
-    
-    # get the html from the website and pass it to BeautifulSoup
-    # reason for using .content instead of .text: https://stackoverflow.com/a/24790752
-    html = requests.get(url).content
-    soup = BeautifulSoup(html, 'html.parser')
-
-    # select all the article link tags
-    article_link_tags = soup.select( link_selector )
-
-    for link_tag in article_link_tags:
-        # skip any link tags without an href attribute
-        # as this results in them not linking to anything
-        if not link_tag.has_attr('href'):
-            continue
 
-        # sometimes, the headline_tag IS the link_tag
-        # for example, if the html looks like this:
-        # <a href=""> The Headline </a>
-        # In cases like this, mark the headline_selector as None
-        # Otherwise, provide an actual headline_selector, and the
-        # first child tag of the link tag matching that given headline_selector
-        # will be made the headline_tag
-        headline_tag = (
-            link_tag if (headline_selector is None)
-            else link_tag.select_one( headline_selector )
-        )
-        
-        # extract headline from the headline_tag, and remove
-        # whitespace, \n, \t from the left and right sides
-        headline = headline_tag.get_text().strip()
-
-        # make the actual article link url
-        # prefix is in case site only uses relative links (e.g. BBC or Detroit News)
-        link = prefix + link_tag['href']
-        
-        # add {headline:link} to the accumulative articles dictionary
-        website_articles[headline] = link
+    # only turn the part of the page we need into a tree
+    # (None means the whole page gets parsed)
+    if parse_only == 'links':
+        strainer = strainer_for_selector(link_selector)
+    elif parse_only is not None:
+        strainer = strainer_for_container(parse_only)
+    else:
+        strainer = None
+
+    # pass the html to BeautifulSoup
+    # reason for using the raw bytes instead of text: https://stackoverflow.com/a/24790752
+    with metrics.timed('parse'):
+        soup = make_soup(html, parser, parse_only=strainer)
+
+    # the selectors are only parsed once, and then reused for every page and every link
+    link_pattern = compile_selector(link_selector)
+    headline_pattern = None if headline_selector is None else compile_selector(headline_selector)
+
+    # picking out the links and headlines is timed separately from building the tree
+    with metrics.timed('select'):
+        # select all the article link tags
+        article_link_tags = link_pattern.select(soup)
+
+        for link_tag in article_link_tags:
+            # skip any link tags without an href attribute
+            # as this results in them not linking to anything
+            if not link_tag.has_attr('href'):
+                continue
+
+            # sometimes, the headline_tag IS the link_tag
+            # for example, if the html looks like this:
+            # <a href=""> The Headline </a>
+            # In cases like this, mark the headline_selector as None
+            # Otherwise, provide an actual headline_selector, and the
+            # first child tag of the link tag matching that given headline_selector
+            # will be made the headline_tag
+            headline_tag = (
+                link_tag if (headline_pattern is None)
+                else headline_pattern.select_one(link_tag)
+            )
+
+            # skip links that don't have a headline inside them
+            if headline_tag is None:
+                continue
+
+            # extract headline from the headline_tag, and remove
+            # whitespace, \n, \t from the left and right sides
+            headline = headline_tag.get_text().strip()
+
+            # make the actual article link url
+            # prefix is in case site only uses relative links (e.g. BBC or Detroit News)
+            link = prefix + link_tag['href']
+
+            # add {headline:link} to the accumulative articles dictionary
+            website_articles[headline] = link
 
     return website_articles
 
@@ -137,41 +210,180 @@ def scrape_website(url, prefix, link_selector, headline_selector):
     takes in a list of dictionaries
     each dict must have certain keys like url, prefix, link_selector, headline_selector
 
+    the websites are scraped concurrently, with at most max_in_flight sites being
+    scraped at the same time, and each site given up on after timeout seconds
+
+    if keywords is given, each website's articles are filtered with filter_relevant,
+    and relevance_mode picks how ('keywords', 'model', 'either' or 'both', see filter_for_keywords.py)
+    if store is given (an article_store.ArticleStore), the articles are also saved into it
+    (along with the keywords each article matched, if keywords is given)
+    if bodies is given (an article_bodies.ArticleBodies), the articles whose headline didn't match
+    the keywords are also kept if the text of the article itself matches (the articles are downloaded
+    in the background, so they are only kept from the crawl after they were downloaded)
+
+    iter_articles is a generator, and yields a ("website name", {"headline": "url"}) tuple
+    for each website as soon as that website is done, so the fastest website comes first
+"""
+def iter_articles(
+    scraper_inputs, max_in_flight=MAX_IN_FLIGHT, timeout=SITE_TIMEOUT, keywords=None, store=None,
+    relevance_mode='keywords', bodies=None,
+):
+    # one scraping job per website, each job is a (name, function) pair
+    # the default argument binds the current website to each lambda
+    jobs = [
+        (website['name'], lambda website=website: scrape_website(**_scrape_arguments(website)))
+        for website in scraper_inputs
+    ]
+
+    # an error in scraping one website will be overlooked and the other
+    # websites will continue, instead of crashing the whole program
+    for name, website_articles, error in scrape_concurrently(jobs, max_in_flight, timeout):
+        if error is not None:
+            _print_error(name, error)
+            continue
+
+        yield name, keep_relevant(name, website_articles, keywords, store, relevance_mode, bodies)
+
+
+"""
+    same as iter_articles, but for asgi_app.py: it's an async generator, the websites are downloaded
+    without blocking the event loop, and the parsing, filtering and saving happen in threads
+"""
+async def iter_articles_async(
+    scraper_inputs, max_in_flight=MAX_IN_FLIGHT, timeout=SITE_TIMEOUT, keywords=None, store=None,
+    relevance_mode='keywords', bodies=None,
+):
+    jobs = [
+        (website['name'], lambda website=website: scrape_website_async(**_scrape_arguments(website)))
+        for website in scraper_inputs
+    ]
+
+    async for name, website_articles, error in scrape_concurrently_async(jobs, max_in_flight, timeout):
+        if error is not None:
+            _print_error(name, error)
+            continue
+
+        yield name, await run_in_thread(keep_relevant, name, website_articles, keywords, store, relevance_mode, bodies)
+
+
+def _print_error(name, error):
+    print('Something went wrong with:')
+    print(name)
+    print('The error is:')
+    print(error)
+
+
+"""
+    filters the articles of one website and saves them into the store, as described above iter_articles
+    also used for the scrapers in website_scrapers (by main.py and asgi_app.py), so every crawl keeps
+    the same articles, counts them the same way at /metrics, and writes them into the store the same way
+"""
+def keep_relevant(name, website_articles, keywords, store=None, relevance_mode='keywords', bodies=None):
+    metrics.articles_found.set(len(website_articles), site=name, stage='scraped')
+    if keywords is not None:
+        with metrics.site_label(name):
+            relevant_articles = filter_relevant(website_articles, keywords, relevance_mode)
+            if bodies is not None:
+                # look inside the articles whose headline didn't match
+                # nothing new is downloaded for the last good articles of a website that is being skipped
+                kept_by_body = bodies.find_relevant(
+                    {headline: url for headline, url in website_articles.items() if headline not in relevant_articles},
+                    keywords, relevance_mode, download=not is_replayed(website_articles),
+                )
+                # keep the order the website had them in (only rebuilt if a body actually added an article)
+                if kept_by_body:
+                    relevant_articles = {
+                        headline: url for headline, url in website_articles.items()
+                        if headline in relevant_articles or headline in kept_by_body
+                    }
+        metrics.articles_found.set(len(relevant_articles), site=name, stage='filtered')
+        # the last good articles of a website that is being skipped stay marked as such (see circuit_breaker.py)
+        if is_replayed(website_articles):
+            relevant_articles = ReplayedArticles(relevant_articles)
+        website_articles = relevant_articles
+
+    # the last good articles of a website that is being skipped weren't seen again, so they aren't written
+    if is_replayed(website_articles):
+        return website_articles
+
+    # only the articles that changed since the last crawl are actually written
+    if store is not None:
+        store.record_crawl({name: website_articles}, keywords=keywords)
+
+    return website_articles
+
+
+"""
+    takes in the same things as iter_articles, but waits for every website to be done
+
     get_articles returns a dictionary where each key is an article headline
     pointing to the url of that article
     {"headline": "url"}
+
+    if window is given (an article_record.ArticleWindow), the articles of each website are put into it
+    as they finish instead, and an ArticleSnapshot of the window is returned
 """
-def get_articles(scraper_inputs):
+def get_articles(
+    scraper_inputs, max_in_flight=MAX_IN_FLIGHT, timeout=SITE_TIMEOUT, keywords=None, store=None,
+    relevance_mode='keywords', bodies=None, window=None,
+):
+    if window is not None:
+        for name, website_articles in iter_articles(
+            scraper_inputs, max_in_flight, timeout, keywords, store, relevance_mode, bodies
+        ):
+            window.update(name, website_articles)
+        return window.snapshot()
+
+    # the articles of each website, keyed by website name, as they finish
+    articles_by_website = dict(
+        iter_articles(scraper_inputs, max_in_flight, timeout, keywords, store, relevance_mode, bodies)
+    )
+
     # create an empty dict to put stuff into
     # will look like {"headline" : "link"}
     # this will include articles from every single website scraped
+    # merge in the original website order, so the result doesn't depend on which site finished first
     all_articles = {}
-
     for website in scraper_inputs:
-        # use try/except blocks so that an error in scraping one website
-        # will be overlooked and the loop will continue to the next website
-        # instead of crashing the whole program
-        try:
-            # get new articles from a new website
-            website_articles = scrape_website(
-                url=website['url'],
-                prefix=website['prefix'],
-                link_selector=website['link_selector'],
-                headline_selector=website['headline_selector']
-            )
-            # add the new articles to the accumulative articles dict
-            all_articles.update(website_articles)
-
-        except:
-            print('Something went wrong with:')
-            print(website)
-            print('The error is:')
-            print(sys.exc_info()[0])
+        all_articles.update(articles_by_website.get(website['name'], {}))
 
     # after scraping every website, return the accumulative articles from every website
     return all_articles
 
 
-articles = get_articles(scraper_inputs)
-print(articles)
+# only scrape when this file is run directly, importing it never makes any network requests
+# with --batch, saved html pages are processed instead of downloading the websites (see snapshot_batch.py)
+if __name__ == '__main__':
+    import argparse
+    import sys
 
+    parser = argparse.ArgumentParser(description='Scrape every website in sites.json')
+    parser.add_argument('--batch', metavar='PATH', help='folder or tar archive of saved pages to process instead of scraping')
+    parser.add_argument('--output', metavar='FILE', help='file the JSON Lines are written to with --batch (default: print them)')
+    parser.add_argument('--workers', type=int, help='number of worker processes used with --batch')
+    parser.add_argument('--no-filter', action='store_true', help='write every article with --batch, not only the ones matching KEYWORDS')
+    arguments = parser.parse_args()
+
+    if arguments.batch is None:
+        articles = get_articles(load_sites())
+        print(articles)
+    else:
+        import snapshot_batch
+        keywords = None
+        relevance_mode = 'keywords'
+        if not arguments.no_filter:
+            # the same keywords the app filters with
+            import main
+            keywords = main.KEYWORDS
+            relevance_mode = main.RELEVANCE_MODE
+        workers = snapshot_batch.BATCH_WORKERS if arguments.workers is None else arguments.workers
+
+        output = sys.stdout if arguments.output is None else open(arguments.output, 'w', encoding='utf-8')
+        try:
+            snapshot_count, article_count = snapshot_batch.run_batch(
+                arguments.batch, output, load_sites(), keywords, relevance_mode, workers
+            )
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        print(f'Found {article_count} articles in {snapshot_count} snapshots', file=sys.stderr)
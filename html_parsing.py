@@ -0,0 +1,111 @@
+# This file turns downloaded html into a BeautifulSoup tree as cheaply as possible
+# It is used by the generalized scraper and by the scrapers in the website_scrapers folder
+
+# Building the full tree of a big news front page is the slowest part of scraping it,
+# so there are two ways to make it faster:
+#   1. a faster parser backend: 'lxml' is several times faster than python's built-in
+#      'html.parser' (it has to be installed with: pip install lxml)
+#   2. only building the parts of the tree we actually need, using a bs4 SoupStrainer,
+#      e.g. only the <a> tags (and whatever is inside them) instead of the whole page
+
+# parser used when a site doesn't pick one
+# can be 'html.parser', 'lxml' or 'html5lib' (the last two have to be installed)
+DEFAULT_PARSER = 'html.parser'
+
+
+#######################################################
+## Configuration Ends Here, Actual Code Begins Below ##
+#######################################################
+
+import re
+from functools import lru_cache
+
+import soupsieve
+from bs4 import BeautifulSoup, FeatureNotFound, SoupStrainer
+
+# parsers that are asked for but aren't installed are remembered here, so we
+# only try (and fail) to use them once
+_missing_parsers = set()
+
+
+"""
+    html is the raw html (bytes or str)
+    parser is the name of the parser backend, like 'lxml' (falls back to 'html.parser' if not installed)
+    parse_only is an optional SoupStrainer, so that only the matching tags are put into the tree
+
+    returns the BeautifulSoup tree
+"""
+def make_soup(html, parser=DEFAULT_PARSER, parse_only=None):
+    if parser in _missing_parsers:
+        parser = 'html.parser'
+
+    # html5lib always builds the whole tree, and warns if it is given a SoupStrainer
+    if parser == 'html5lib':
+        parse_only = None
+
+    try:
+        return BeautifulSoup(html, parser, parse_only=parse_only)
+    except FeatureNotFound:
+        print(f'The {parser} parser is not installed, using html.parser instead')
+        _missing_parsers.add(parser)
+        return BeautifulSoup(html, 'html.parser', parse_only=parse_only)
+
+
+# matches a simple css selector like 'a', 'a.promo', 'div#main', 'a[href ^= "/news"].heading'
+# (a tag name, followed by any number of .classes, #ids and [attribute] filters)
+# [^\]"']|"[^"]*"|'[^']*' makes sure quoted attribute values may contain any character
+_COMPOUND_SELECTOR = re.compile(
+    r'''\s*([a-zA-Z][a-zA-Z0-9-]*)((?:[.#][\w-]+|\[(?:[^\]"']|"[^"]*"|'[^']*')*\])*)\s*'''
+)
+
+
+"""
+    selector is a css selector string
+
+    returns the compiled selector (a soupsieve pattern), with .select(tag) and .select_one(tag)
+    soup.select(selector) parses the selector string again on every call, which adds up when
+    it's called once for every link on the page, so compile it once and reuse it instead
+    raises soupsieve.SelectorSyntaxError if the selector is invalid
+"""
+@lru_cache(maxsize=256)
+def compile_selector(selector):
+    return soupsieve.compile(selector)
+
+
+"""
+    link_selector is the css selector used to pick the article link tags
+
+    returns a SoupStrainer that only keeps the tags the selector can match (and everything
+    inside them), or None if the selector needs more of the page than that
+
+    selecting with link_selector from the strained tree gives exactly the same tags as
+    selecting from the full tree, so None is returned for anything that looks at the
+    rest of the page: combinators ('div a', 'ul > a'), several selectors ('a, h3'),
+    and pseudo-classes like ':nth-child'
+"""
+def strainer_for_selector(link_selector):
+    match = _COMPOUND_SELECTOR.fullmatch(link_selector)
+    if match is None:
+        return None
+    return SoupStrainer(match.group(1).lower())
+
+
+"""
+    container is a simple selector like 'main', 'div#content' or 'section.stories'
+    (a tag name, optionally followed by one #id and/or one .class)
+
+    returns a SoupStrainer that only keeps the matching container tag(s) and everything
+    inside them, or None if the container selector isn't that simple
+"""
+def strainer_for_container(container):
+    match = re.fullmatch(r'\s*([a-zA-Z][a-zA-Z0-9-]*)(?:#([\w-]+))?(?:\.([\w-]+))?\s*', container)
+    if match is None:
+        return None
+
+    tag_name, element_id, class_name = match.groups()
+    attrs = {}
+    if element_id:
+        attrs['id'] = element_id
+    if class_name:
+        attrs['class'] = class_name
+    return SoupStrainer(tag_name.lower(), attrs=attrs)
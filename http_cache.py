@@ -0,0 +1,138 @@
+# This file remembers, on disk, what every scraped page looked like the last time we crawled it
+# For each url it stores the page's ETag / Last-Modified validators together with the already
+# parsed {"headline": "url"} result. On the next crawl the validators are sent back to the website
+# (If-None-Match / If-Modified-Since), and if the website answers "304 Not Modified" we skip both
+# downloading the page and parsing it with BeautifulSoup, and just reuse the stored result
+
+import os
+
+# folder the cached pages are stored in (delete it to start with an empty cache)
+HTTP_CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.http_cache')
+
+# set to False to always download and parse every page
+HTTP_CACHE_ENABLED = True
+
+
+#######################################################
+## Configuration Ends Here, Actual Code Begins Below ##
+#######################################################
+
+import hashlib
+import json
+import tempfile
+
+import http_client
+import parse_pool
+
+
+# the file a cache entry is stored in
+# parse_key is part of the name so that changing a site's selectors
+# doesn't reuse articles that were parsed with the old selectors
+def _entry_path(url, parse_key):
+    digest = hashlib.sha1(f'{url}\n{parse_key}'.encode('utf-8')).hexdigest()
+    return os.path.join(HTTP_CACHE_FOLDER, digest + '.json')
+
+
+def _load_entry(path):
+    try:
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        # a missing or corrupted entry is the same as no entry
+        return None
+
+
+def _save_entry(path, entry):
+    os.makedirs(HTTP_CACHE_FOLDER, exist_ok=True)
+    # write to a temporary file first and then rename it over the old entry,
+    # so a crash (or another thread) never sees a half written file
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=HTTP_CACHE_FOLDER, suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'w', encoding='utf-8') as file:
+            json.dump(entry, file)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+"""
+    url is the page to download
+    parse_function takes the raw html bytes (and then parse_args) and returns a {"headline": "url"} dictionary
+    it's run with parse_pool.parse, so it may run in a worker process (see parse_pool.py)
+    parse_key is any string that identifies how the page is parsed (e.g. the css selectors)
+    fetch_options is an optional dict of http_client settings
+
+    returns the {"headline": "url"} dictionary, either freshly parsed or, when the
+    website says the page hasn't changed, straight from the cache
+"""
+def scrape_cached(url, parse_function, parse_args=(), parse_key='', fetch_options=None):
+    fetch_options = fetch_options or {}
+
+    if not HTTP_CACHE_ENABLED:
+        return parse_pool.parse(parse_function, http_client.fetch(url, **fetch_options), *parse_args)
+
+    path = _entry_path(url, parse_key)
+    entry = _load_entry(path)
+
+    page = http_client.get(url, headers=_validator_headers(entry), **fetch_options)
+
+    # the page hasn't changed, so there's nothing to download or parse
+    if page.status_code == 304 and entry is not None:
+        return entry['articles']
+
+    articles = parse_pool.parse(parse_function, page.content, *parse_args)
+    _save_page(path, url, page, articles)
+    return articles
+
+
+"""
+    same as scrape_cached, but for asgi_app.py: the page is downloaded with async_http_client, and
+    the parsing and the cache files are done in a thread, so the event loop is never blocked
+"""
+async def scrape_cached_async(url, parse_function, parse_args=(), parse_key='', fetch_options=None):
+    # only imported here, so the normal (threaded) app doesn't need aiohttp
+    import async_http_client
+    from async_scraping import run_in_thread
+
+    fetch_options = fetch_options or {}
+
+    if not HTTP_CACHE_ENABLED:
+        html = await async_http_client.fetch(url, **fetch_options)
+        return await run_in_thread(parse_pool.parse, parse_function, html, *parse_args)
+
+    path = _entry_path(url, parse_key)
+    entry = await run_in_thread(_load_entry, path)
+
+    page = await async_http_client.get(url, headers=_validator_headers(entry), **fetch_options)
+
+    if page.status_code == 304 and entry is not None:
+        return entry['articles']
+
+    articles = await run_in_thread(parse_pool.parse, parse_function, page.content, *parse_args)
+    await run_in_thread(_save_page, path, url, page, articles)
+    return articles
+
+
+# the validators the website gave us last time, to send back to it
+def _validator_headers(entry):
+    headers = {}
+    if entry is not None:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+def _save_page(path, url, page, articles):
+    etag = page.headers.get('ETag')
+    last_modified = page.headers.get('Last-Modified')
+    # pages without any validators can't be revalidated, so don't bother storing them
+    if etag or last_modified:
+        _save_entry(path, {
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'articles': articles,
+        })
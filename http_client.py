@@ -0,0 +1,172 @@
+# This file is the one place where every scraper downloads html from
+# It keeps one pooled keep-alive session per website host, so repeated crawls reuse
+# the same TCP/TLS connections instead of doing a fresh handshake for every request
+
+# Every setting below is a default, and can be overridden for a single site by adding
+# for example {"name": "Slow Site", ..., "read_timeout": 30, "retries": 4}
+
+# seconds to wait for the connection to the website to open
+CONNECT_TIMEOUT = 5
+
+# seconds to wait for the website to send the next piece of data
+READ_TIMEOUT = 15
+
+# how many more times a failed request is tried before giving up
+RETRIES = 2
+
+# seconds to wait before the first retry, doubles with each retry after that
+BACKOFF = 0.5
+
+# pages bigger than this many bytes are abandoned instead of downloaded
+MAX_BYTES = 10 * 1024 * 1024
+
+# maximum number of open connections kept alive per host
+POOL_SIZE = 10
+
+# the names of the settings that can be overridden per site
+FETCH_OPTIONS = ['connect_timeout', 'read_timeout', 'retries', 'backoff', 'max_bytes']
+
+
+#######################################################
+## Configuration Ends Here, Actual Code Begins Below ##
+#######################################################
+
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# http status codes that are worth trying again, because the website may just be busy
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class ResponseTooLarge(Exception):
+    pass
+
+
+"""
+    a downloaded page: its final url (after redirects), status code, headers,
+    and the raw bytes of the body
+"""
+class Page:
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+
+# one requests.Session per host, so each host gets its own pool of keep-alive connections
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _session_for(url):
+    host = urlsplit(url).netloc.lower()
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[host] = session
+        return session
+
+
+# reads the body of a streamed response, but stops as soon as it gets bigger than max_bytes
+def _read_capped(response, max_bytes):
+    content_length = response.headers.get('Content-Length')
+    if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+        raise ResponseTooLarge(f'{response.url} is {content_length} bytes (max is {max_bytes})')
+
+    chunks = []
+    size = 0
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        size += len(chunk)
+        if size > max_bytes:
+            raise ResponseTooLarge(f'{response.url} is bigger than {max_bytes} bytes')
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+# exponential backoff with "full jitter", so that many scrapers retrying
+# the same host don't all hit it again at the exact same moment
+def _sleep_before_retry(attempt, backoff):
+    time.sleep(random.uniform(0, backoff * (2 ** attempt)))
+
+
+"""
+    downloads the url and returns a Page
+
+    connection errors, timeouts and busy-server status codes (429, 5xx) are retried
+    up to `retries` times, other error status codes raise requests.HTTPError
+    headers is an optional dict of extra request headers
+"""
+def get(
+    url,
+    headers=None,
+    connect_timeout=CONNECT_TIMEOUT,
+    read_timeout=READ_TIMEOUT,
+    retries=RETRIES,
+    backoff=BACKOFF,
+    max_bytes=MAX_BYTES,
+):
+    session = _session_for(url)
+    # measurements are labeled with the site being scraped, or the host if we don't know the site
+    site = metrics.current_site(default=urlsplit(url).netloc.lower())
+
+    for attempt in range(retries + 1):
+        is_last_attempt = attempt == retries
+        try:
+            # stream=True so the body is only downloaded by _read_capped, which enforces max_bytes
+            # so this only takes as long as connecting and waiting for the response headers
+            with metrics.timed('connect', site):
+                response = session.get(
+                    url,
+                    headers=headers,
+                    timeout=(connect_timeout, read_timeout),
+                    stream=True,
+                )
+
+            with response:
+                if response.status_code in RETRY_STATUS_CODES and not is_last_attempt:
+                    metrics.errors.inc(site=site, stage='status')
+                    _sleep_before_retry(attempt, backoff)
+                    continue
+
+                if response.status_code >= 400:
+                    metrics.errors.inc(site=site, stage='status')
+                response.raise_for_status()
+
+                with metrics.timed('download', site):
+                    content = _read_capped(response, max_bytes)
+                metrics.response_bytes.inc(len(content), site=site)
+
+                return Page(response.url, response.status_code, response.headers, content)
+
+        except (requests.ConnectionError, requests.Timeout):
+            if is_last_attempt:
+                raise
+            _sleep_before_retry(attempt, backoff)
+
+
+"""
+    downloads the url and returns the raw bytes of the page
+    takes the same settings as get()
+"""
+def fetch(url, **fetch_options):
+    return get(url, **fetch_options).content
+
+
+"""
+    picks out the fetch settings (like 'read_timeout' or 'retries') from
+    a site's dict in sites.json, to be passed on to get() or fetch()
+"""
+def fetch_options_for(website):
+    return {option: website[option] for option in FETCH_OPTIONS if option in website}
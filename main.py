@@ -13,7 +13,9 @@ https://victormerino.medium.com/running-a-python-script-24-7-in-cloud-for-free-a
 SCRAPERS_FOLDER_NAME = 'website_scrapers'
 
 """
-To add new scrapers, put the scraping function into its own file in the website_scrapers folder.
+To add new scrapers, put the scraping function into its own file in the website_scrapers folder,
+and mark it with the @register_scraper decorator from scraper_registry.py.
+Importing that file must not do anything else (like scraping), because the file is imported when the app starts.
 
 See the existing examples in the website_scrapers folder for clarification.
 
@@ -167,111 +169,522 @@ KEYWORDS = [
   'zero emissions',
 ]
 
+# how the articles that are actually about the environment are picked:
+#   'keywords'  articles whose titles contain at least 1 of the KEYWORDS
+#   'model'     articles the trained model scores as environmental news (see relevance_scorer.py,
+#               which also explains how to train the model, and needs numpy)
+#   'either'    articles picked by the keywords or by the model
+#   'both'      articles picked by the keywords and by the model
+RELEVANCE_MODE = 'keywords'
+
+# if True, articles whose headline isn't picked are also downloaded, and picked if the text of the
+# article itself is about the environment (each article is only downloaded once, see article_bodies.py)
+# the articles are downloaded in the background, so they show up from the crawl after they were downloaded
+FETCH_ARTICLE_BODIES = False
+
+# number of seconds a crawl is served from memory before it is refreshed in the background
+CACHE_TTL = 300
+
+# if True, a page view that has to wait for a crawl (because nothing was crawled yet) streams the
+# articles to the browser as each site finishes, instead of showing nothing until every site is done
+# every page view that comes in while that crawl is running follows the same crawl, instead of starting its own
+STREAM_PAGES = True
+
+# if True, each site is re-crawled on its own schedule, which speeds up for sites that change often
+# and slows down for sites that rarely change (see crawl_scheduler.py for the settings)
+# if False, every site is re-crawled at the same time, every CACHE_TTL seconds
+ADAPTIVE_CRAWLING = True
+
+# if True, articles about the same story from different websites (near-identical headlines) are only
+# shown once, with links to the other websites under it (see dedup_headlines.py for the settings)
+DEDUPLICATE_HEADLINES = True
+
+# how many articles are shown when the page is asked for articles from the history (?since= or ?limit=)
+HISTORY_LIMIT = 100
+
+# how many articles a page of /api/articles has when ?limit= isn't given (it's never more than 100)
+API_PAGE_SIZE = 50
+
 ################################################################
 # Configuration Stuff Above, Main Code Below
 ################################################################
 
 # flask: web framework for rendering website
-from flask import Flask, render_template
+from flask import Flask, render_template, request, abort, Response, stream_with_context, jsonify
+
+# datetime: reads the ?since= time of the history queries
+from datetime import datetime
 
-# importlib: dynamically import scrapers (no need to add new functions and stuff below when additional scrapers are made)
-from importlib import import_module 
+# generalized_scraper: scrapes any news site from just a few css selectors (importing it doesn't scrape anything)
+import generalized_scraper
 
-from filter_for_keywords import filter_for_keywords
+# site_config: loads the websites of the generalized scraper from sites.json, and again whenever it changes
+from site_config import load_sites
 
-# dynamically imports the scraper functions from the scrapers array (each scraper in the array is itself an array where the first item is the name of the file the scraper is in and the second item the name of the scraping function within that file)
-# returns a list of all the imported scraper functions
-def import_scraper_functions(folder_name, scrapers):
-  # list to be returned at end containing all the imported scraper functions
-  all_scraper_functions = []
+# article_cache: keeps the last crawl in memory and refreshes it in the background
+from article_cache import ArticleCache
 
-  # import each scraper_function, and use it to
-  # scrape and filter articles from each website
-  # and finally add every article into all_articles
-  for file_name, function_name in scrapers:
-    # remove the .py from end if its included in original file_name
-    # this is because import_module only takes in the file_name without any .py extension
-    if file_name.endswith('.py'):
-      file_name = file_name[:-3]
+# metrics: per site, per stage timings, shown at /metrics
+import metrics
 
-    # format the filepath so that it can be imported by import_module
-    formatted_filepath = folder_name + '.' + file_name
+# circuit_breaker: skips websites that keep failing for a while, the state of every website is shown at /health
+import circuit_breaker
 
-    # import the file containing the scraping function
-    scraper_file = import_module(formatted_filepath)
+# article_store: sqlite history of every article ever scraped
+from article_store import ArticleStore
 
-    # get the actual scraping function from the imported file
-    scraper_function = getattr(scraper_file, function_name)
+# article_bodies: downloads the articles whose headlines don't say what they're about
+from article_bodies import ArticleBodies
 
+# concurrent_scraping: runs the scrapers at the same time instead of 1-by-1
+from concurrent_scraping import scrape_concurrently, MAX_IN_FLIGHT, SITE_TIMEOUT
 
-    # add newly imported scraper function to the overarching list
-    all_scraper_functions.append(scraper_function)
+# crawl_scheduler: re-crawls each site as often as that site actually changes
+from crawl_scheduler import CrawlScheduler, MAX_INTERVAL
 
-  return all_scraper_functions
+# dedup_headlines: groups the headlines of different websites that are about the same story
+from dedup_headlines import HeadlineClusterer
+
+# page_cache: keeps the rendered (and gzipped) pages of each crawl, split into pages of PAGE_SIZE articles
+import page_cache
+
+# article_record: keeps the articles of the recent crawls in memory, without ever using more than a set amount
+from article_record import ArticleWindow
+
+# urllib: finds the host of each website, so the crawl scheduler doesn't hit the same host too often at once
+from urllib.parse import urlsplit
+
+# scraper_registry: dynamically imports the scrapers (no need to add new functions and stuff below when additional scrapers are made)
+# the scrapers are only imported once, the first time they are needed
+from scraper_registry import load_scrapers, scraper_website
 
 # runs all the scraper functions in the list given to it
 # and uses them to scrape, and filter, the articles from each website
-# finally, it returns a giant dictionary containing all the scraped and filtered articles across all the websites
-# this function may need to be made async in the future, if it takes too much time to run all the scrapers 1-by-1
-def get_articles(scraper_functions, keywords):
+# the scrapers run concurrently (at most max_in_flight at once), so a slow website doesn't hold up the others
+# if a store is given (an article_store.ArticleStore), the articles are also saved into it, along with which keywords they matched
+# if FETCH_ARTICLE_BODIES is on, the text of the articles whose headline didn't match is checked as well
+# this is a generator, which yields a (scraper name, filtered articles dictionary) tuple as soon as each website is done
+def iter_articles(scraper_functions, keywords, max_in_flight=MAX_IN_FLIGHT, timeout=SITE_TIMEOUT, store=None):
+  jobs = [(scraper_function.__name__, scraper_function) for scraper_function in scraper_functions]
+
+  for name, scraped_articles, error in scrape_concurrently(jobs, max_in_flight, timeout):
+    # a broken website shouldn't take the whole page down with it
+    if error is not None:
+      print('Something went wrong with: ' + name)
+      print('The error is:')
+      print(error)
+      continue
+
+    yield name, generalized_scraper.keep_relevant(
+      name, scraped_articles, keywords, store, RELEVANCE_MODE, article_bodies_stage()
+    )
+
+
+# same as iter_articles, but waits for every website to be done
+# and returns a giant dictionary containing all the scraped and filtered articles across all the websites
+# if a window (an article_record.ArticleWindow) is given, the articles of each website go straight into it
+# instead, and an ArticleSnapshot of the window is returned, without combining them into another dictionary
+def get_articles(scraper_functions, keywords, max_in_flight=MAX_IN_FLIGHT, timeout=SITE_TIMEOUT, store=None, window=None):
+  if window is not None:
+    for name, filtered_articles in iter_articles(scraper_functions, keywords, max_in_flight, timeout, store):
+      window.update(name, filtered_articles)
+    return window.snapshot()
+
+  # the filtered articles of each scraper, keyed by the scraper's name
+  articles_by_scraper = dict(iter_articles(scraper_functions, keywords, max_in_flight, timeout, store))
+
   # will use this to return combined filtered articles dictionary across all websites
   # keys are article titles, vals are article url's
+  # add the articles in the original scraper order, so the result doesn't depend on which website finished first
   all_articles = {}
-
   for scraper_function in scraper_functions:
-    # run the scraper
-    scraped_articles = scraper_function()
-    filtered_articles = filter_for_keywords(scraped_articles, keywords)
-    # add scraped & filtered articles from a particular website to all_articles
-    all_articles.update(filtered_articles)
+    all_articles.update(articles_by_scraper.get(scraper_function.__name__, {}))
   
   return all_articles
 
 app = Flask('app')
 
+# every article ever scraped, so the page can show the history and not only the last crawl
+# it is opened the first time it's needed, so importing this file doesn't create the database
+_article_store = None
+
+def get_article_store():
+  global _article_store
+  if _article_store is None:
+    _article_store = ArticleStore()
+  return _article_store
+
+# the article body cache, also only opened the first time it's needed
+_article_bodies = None
+
+def get_article_bodies():
+  global _article_bodies
+  if _article_bodies is None:
+    _article_bodies = ArticleBodies()
+  return _article_bodies
+
+# the article body stage (for generalized_scraper.keep_relevant), None when FETCH_ARTICLE_BODIES is off
+def article_bodies_stage():
+  return get_article_bodies() if FETCH_ARTICLE_BODIES else None
+
+# the crawl scheduler jobs of the scrapers, one per scraper, which returns the scraper's filtered articles
+# (or None if it failed)
+def scraper_jobs(scraper_functions):
+  return [
+    (
+      scraper_function.__name__,
+      urlsplit(scraper_website(scraper_function) or '').netloc or scraper_function.__name__,
+      lambda scraper_function=scraper_function: dict(
+        iter_articles([scraper_function], KEYWORDS, store=get_article_store())
+      ).get(scraper_function.__name__),
+    )
+    for scraper_function in scraper_functions
+  ]
+
+# does a full crawl with the scrapers in the SCRAPERS array
+def crawl_scrapers():
+  # the various scraper functions we made (only imported on the very first crawl)
+  scraper_functions = load_scrapers(SCRAPERS_FOLDER_NAME, SCRAPERS)
+
+  if ADAPTIVE_CRAWLING:
+    return get_scheduler('scrapers', scraper_jobs(scraper_functions), scrapers_cache, article_windows['/']).crawl_all()
+
+  # run the scraper functions, and filter the scraped articles, and put them all into the route's window
+  return get_articles(scraper_functions, KEYWORDS, store=get_article_store(), window=article_windows['/'])
+
+# the websites (from sites.json) the generalized scraper crawled last, to notice when the file changes
+_crawled_websites = None
+
+# the crawl scheduler jobs of the generalized scraper, one per website
+def website_jobs(websites):
+  return [
+    (
+      website['name'],
+      urlsplit(website['url']).netloc,
+      lambda website=website: dict(
+        generalized_scraper.iter_articles(
+          [website], keywords=KEYWORDS, store=get_article_store(), relevance_mode=RELEVANCE_MODE,
+          bodies=article_bodies_stage(),
+        )
+      ).get(website['name']),
+    )
+    for website in websites
+  ]
+
+# does a full crawl with the generalized scraper
+def crawl_generalized_scraper():
+  global _crawled_websites
+  websites = _crawled_websites = load_sites()
+
+  if ADAPTIVE_CRAWLING:
+    return get_scheduler(
+      'generalized_scraper', website_jobs(websites), generalized_scraper_cache, article_windows['/generalized_scraper']
+    ).crawl_all()
+
+  return generalized_scraper.get_articles(
+    websites, keywords=KEYWORDS, store=get_article_store(), relevance_mode=RELEVANCE_MODE,
+    bodies=article_bodies_stage(), window=article_windows['/generalized_scraper'],
+  )
+
+# the articles of the recent crawls of each route, this is what the page shows
+# every crawl (and every streamed page) adds its articles to it, and articles that haven't been seen for a
+# while are forgotten (see article_record.py for how long, and how many articles are kept at most)
+article_windows = {
+  '/': ArticleWindow(),
+  '/generalized_scraper': ArticleWindow(),
+}
+
+# the crawl schedulers of each route, only made on the first crawl
+# after that, each site is re-crawled in the background on its own schedule,
+# and every change is put straight into the route's article cache
+_schedulers = {}
+
+def get_scheduler(name, jobs, cache, window=None):
+  if name not in _schedulers:
+    _schedulers[name] = CrawlScheduler(jobs, on_update=cache.put, window=window)
+  else:
+    # the websites may have changed since the scheduler was made (see site_config.py)
+    _schedulers[name].set_jobs(jobs)
+  return _schedulers[name]
+
+# the last crawl of each route, page views are answered from these instead of scraping every time
+# with adaptive crawling the sites are kept up to date by the crawl scheduler, so the cache
+# only does a full crawl of every site if nothing changed for as long as the longest crawl interval
+CRAWL_TTL = MAX_INTERVAL if ADAPTIVE_CRAWLING else CACHE_TTL
+scrapers_cache = ArticleCache(crawl_scrapers, ttl=CRAWL_TTL)
+generalized_scraper_cache = ArticleCache(crawl_generalized_scraper, ttl=CRAWL_TTL)
+
+# the stories seen by each route, so every story is only shown once
+# headlines are added to these as they're shown, and never compared again after that
+headline_clusters = {
+  '/': HeadlineClusterer(),
+  '/generalized_scraper': HeadlineClusterer(),
+}
+
+# keeps one article per story (the first one that was seen) if DEDUPLICATE_HEADLINES is on
+def deduplicate(route, articles):
+  if not DEDUPLICATE_HEADLINES:
+    return articles
+  return headline_clusters[route].deduplicate(articles)
+
+# the function templates/main.html calls to list the other websites of a story
+def other_urls_function(route):
+  if not DEDUPLICATE_HEADLINES:
+    return None
+  return headline_clusters[route].siblings
+
+# renders templates/main.html with one page of a route's articles (also used by asgi_app.py)
+# page and page_count are for the links to the other pages, and are None when there's only one page anyway
+def render_main_page(route, articles, page=None, page_count=None):
+  with metrics.timed('render', site=route):
+    return app.jinja_env.get_template('main.html').render(
+      articles=articles, other_urls=other_urls_function(route), page=page, page_count=page_count
+    )
+
+# the rendered pages of the last crawl of each route
+page_caches = {
+  route: page_cache.PageCache(lambda articles, page, page_count, route=route: render_main_page(route, articles, page, page_count))
+  for route in ('/', '/generalized_scraper')
+}
+
+# answers a page view from the last crawl of cache, rendering it only if this page of this crawl wasn't rendered yet
+def cached_page(route, cache):
+  # read before the articles, so a crawl that finishes in between only makes the next page view render again
+  version = cache.version
+  # the last crawl result (a refresh happens in the background once it gets older than CACHE_TTL)
+  articles = cache.get()
+
+  rendered = page_caches[route].get(version, lambda: deduplicate(route, articles), request.args.get('page', 1, type=int))
+  if rendered is None:
+    abort(404)
+
+  status, headers, body = page_cache.respond(
+    rendered, request.headers.get('Accept-Encoding'), request.headers.get('If-None-Match')
+  )
+  return Response(body, status=status, headers=headers)
+
+# shows just the website of a url, for the "also at" links
+@app.template_filter('host')
+def host_filter(url):
+  return urlsplit(url).netloc or url
+
+# answers ?since= and ?limit= from the article history instead of the last crawl
+# since can be a unix time or an iso date like 2021-03-01T12:00:00
+# sources is the list of source names the articles have to come from
+# returns None when neither is in the url, so the last crawl should be shown instead
+def get_articles_from_history(sources):
+  since = request.args.get('since')
+  limit = request.args.get('limit', type=int)
+  if since is None and limit is None:
+    return None
+
+  # at least 1, sqlite would read LIMIT -1 as no limit at all
+  limit = HISTORY_LIMIT if limit is None else max(1, min(limit, HISTORY_LIMIT))
+  if since is None:
+    return get_article_store().latest(limit, sources)
+
+  return get_article_store().new_since(parse_since(since), limit, sources)
+
+# turns the ?since= of the url into a unix time (answering 400 if it's neither a unix time nor an iso date)
+def parse_since(since):
+  try:
+    return float(since)
+  except ValueError:
+    try:
+      return datetime.fromisoformat(since).timestamp()
+    except ValueError:
+      abort(400, 'since must be a unix time or an iso date')
+
+# looks like the articles dictionary to templates/main.html, but instead of having every article
+# up front, its items() yields the articles of each website as soon as that website is done
+# articles_by_website is usually the follow() of a streamed crawl (see stream_crawl)
+# if a clusterer (a dedup_headlines.HeadlineClusterer) is given, only the first article of each story is yielded
+# only the first limit articles are yielded, and more is set to True if there were others after them
+class StreamedArticles:
+  def __init__(self, articles_by_website, clusterer=None, limit=page_cache.PAGE_SIZE):
+    self.articles_by_website = articles_by_website
+    self.clusterer = clusterer
+    self.limit = limit
+    self.more = False
+    self.shown = 0
+
+  def items(self):
+    seen_headlines = set()
+    shown_stories = set()
+    for _, website_articles in self.articles_by_website:
+      yield from self.articles_to_show(website_articles, seen_headlines, shown_stories)
+
+  # yields the articles of one website that aren't on the page yet
+  # (also used by asgi_app.AsyncStreamedArticles)
+  def articles_to_show(self, website_articles, seen_headlines, shown_stories):
+    for headline, url in website_articles.items():
+      # the same headline from a second website would be a duplicate card
+      if headline not in seen_headlines:
+        if self.clusterer is None:
+          yield from self._limited(headline, url)
+        else:
+          story = self.clusterer.add(headline, url)
+          if id(story) not in shown_stories:
+            shown_stories.add(id(story))
+            yield from self._limited(story.headline, story.url)
+      seen_headlines.add(headline)
+
+  # yields the article if the page isn't full yet
+  def _limited(self, headline, url):
+    if self.shown < self.limit:
+      self.shown += 1
+      yield headline, url
+    else:
+      self.more = True
+
+# whether this page view should stream the first crawl instead of waiting for it
+# (only the first page is streamed, the other pages wait for the crawl)
+def should_stream(cache):
+  if request.args.get('page', 1, type=int) != 1:
+    return False
+  return STREAM_PAGES and cache.snapshot is None
+
+# starts the crawl of a route that page views stream (or returns the one that is already running),
+# see ArticleCache.stream, so every page view that comes in before the first crawl is done follows the
+# same crawl instead of starting its own one
+# articles_by_website_function returns the (website name, articles) of every website as it's done, which
+# go into window (the route's article_record.ArticleWindow), and the window becomes the cache's snapshot
+# once the crawl is done
+# with adaptive crawling, the crawl scheduler takes over once the crawl is done (see CrawlScheduler.schedule_all),
+# get_scheduler_function returns the route's scheduler (that's the only time it's called)
+# returns None if a crawl that can't be streamed is already running
+def stream_crawl(cache, window, articles_by_website_function, get_scheduler_function):
+  def crawl():
+    for name, website_articles in articles_by_website_function():
+      window.update(name, website_articles)
+      yield name, website_articles
+
+  def finish():
+    # the cache only does a full crawl every CRAWL_TTL, so without the scheduler no site would be crawled again until then
+    if ADAPTIVE_CRAWLING:
+      get_scheduler_function().schedule_all()
+    return window.snapshot()
+
+  return cache.stream(crawl, finish)
+
+# renders templates/main.html in pieces, sending each piece to the browser as soon as it's rendered
+# so the first article cards show up as soon as the fastest website is done
+def stream_page(articles, other_urls=None):
+  template = app.jinja_env.get_template('main.html')
+  response = Response(
+    stream_with_context(template.generate(articles=articles, other_urls=other_urls)), mimetype='text/html'
+  )
+  # stop proxies like nginx from holding on to the pieces until the page is complete
+  response.headers['X-Accel-Buffering'] = 'no'
+  return response
+
 @app.route('/')
 def main():
-  # import the various scraper functions we made
-  scraper_functions = import_scraper_functions(SCRAPERS_FOLDER_NAME, SCRAPERS)
+  # the sources in the history are named after the scraper functions
+  articles = get_articles_from_history([function_name for _, function_name in SCRAPERS])
+
+  if articles is None and should_stream(scrapers_cache):
+    # the streamed crawl is also kept, so the next page views don't have to crawl again
+    scraper_functions = load_scrapers(SCRAPERS_FOLDER_NAME, SCRAPERS)
+    crawl = stream_crawl(
+      scrapers_cache, article_windows['/'],
+      lambda: iter_articles(scraper_functions, KEYWORDS, store=get_article_store()),
+      lambda: get_scheduler('scrapers', scraper_jobs(scraper_functions), scrapers_cache, article_windows['/']),
+    )
+    if crawl is not None:
+      clusterer = headline_clusters['/'] if DEDUPLICATE_HEADLINES else None
+      return stream_page(StreamedArticles(crawl.follow(), clusterer=clusterer), other_urls=other_urls_function('/'))
 
-  # run the scraper functions, and filter the scraped articles, and combine all articles into one dictionary
-  articles = get_articles(scraper_functions, KEYWORDS)
+  if articles is None:
+    return cached_page('/', scrapers_cache)
 
   # make the actual website
-  return render_template('main.html', articles=articles )
+  with metrics.timed('render', site='/'):
+    return render_template('main.html', articles=deduplicate('/', articles), other_urls=other_urls_function('/'))
 
 @app.route('/generalized_scraper')
 def run_generalized_scraper():
-  import generalized_scraper
-
-  scraper_inputs = [
-    {
-      'name': 'BBC Science & Environment',
-      'url': 'https://www.bbc.com/news/science_and_environment',
-      'prefix': 'https://bbc.com',
-      'link_selector': 'a[href ^= "/news"].gs-c-promo-heading',
-      'headline_selector': 'h3',
-    },
-    {
-      'name': 'Detroit News',
-      'url': 'https://www.detroitnews.com/news/',
-      'prefix': 'https://www.detroitnews.com/story',
-      'link_selector': 'a.gnt_m_flm_a',
-      'headline_selector': None,
-    },
-    {
-      'name': 'Mlive',
-      'url': 'https://www.mlive.com/',
-      'prefix': '',
-      'link_selector': 'a[data-ga-content-type = "article"]',
-      'headline_selector': None,
-    }
-  ]
+  global _crawled_websites
+  websites = load_sites()
+  # sites.json changed since the last crawl, so crawl again in the background with the new websites
+  if _crawled_websites is not None and websites is not _crawled_websites:
+    generalized_scraper_cache.invalidate()
+
+  articles = get_articles_from_history([website['name'] for website in websites])
+
+  if articles is None and should_stream(generalized_scraper_cache):
+    crawl = stream_crawl(
+      generalized_scraper_cache, article_windows['/generalized_scraper'], lambda: generalized_scraper.iter_articles(
+        websites, keywords=KEYWORDS, store=get_article_store(), relevance_mode=RELEVANCE_MODE,
+        bodies=article_bodies_stage(),
+      ),
+      lambda: get_scheduler(
+        'generalized_scraper', website_jobs(websites), generalized_scraper_cache, article_windows['/generalized_scraper']
+      ),
+    )
+    if crawl is not None:
+      # the streamed crawl is the first crawl, so later edits of sites.json are noticed like after crawl_generalized_scraper
+      _crawled_websites = websites
+      clusterer = headline_clusters['/generalized_scraper'] if DEDUPLICATE_HEADLINES else None
+      return stream_page(
+        StreamedArticles(crawl.follow(), clusterer=clusterer), other_urls=other_urls_function('/generalized_scraper')
+      )
+
+  if articles is None:
+    return cached_page('/generalized_scraper', generalized_scraper_cache)
+
+  with metrics.timed('render', site='/generalized_scraper'):
+    return render_template(
+      'main.html', articles=deduplicate('/generalized_scraper', articles), other_urls=other_urls_function('/generalized_scraper')
+    )
+
+# every article in the history as json, one page at a time, newest first
+# ?keyword= only the articles whose headline matched that keyword (one of the KEYWORDS)
+# ?source= only the articles of that source (a scraper function name or generalized scraper website name)
+# ?since= only the articles first seen after that unix time or iso date
+# ?limit= the number of articles per page (at most 100)
+# ?cursor= the next_cursor of the previous page, to get the page after it
+@app.route('/api/articles')
+def api_articles():
+  since = request.args.get('since')
+  try:
+    articles, next_cursor = get_article_store().search(
+      keyword=request.args.get('keyword'),
+      source=request.args.get('source'),
+      since=None if since is None else parse_since(since),
+      limit=request.args.get('limit', API_PAGE_SIZE, type=int),
+      cursor=request.args.get('cursor'),
+    )
+  except ValueError as error:
+    abort(400, str(error))
+
+  return jsonify(articles=articles, next_cursor=next_cursor)
+
+# timings, byte counts, article counts and error counts of every site, in the Prometheus text format
+@app.route('/metrics')
+def show_metrics():
+  return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
 
-  articles = generalized_scraper.get_articles(scraper_inputs)
+# the circuit breaker of every website as json, so you can see which websites are broken
+# status is 'degraded' instead of 'ok' if any website is currently being skipped, but the answer is
+# still 200, because the app keeps serving the articles it has (a load balancer shouldn't take it down
+# just because one of the news websites is down)
+@app.route('/health')
+def health():
+  websites = circuit_breaker.all_statuses()
+  healthy = all(website['state'] == circuit_breaker.CLOSED for website in websites.values())
+  return jsonify(status='ok' if healthy else 'degraded', websites=websites)
 
-  articles = filter_for_keywords(articles, KEYWORDS)
+# manual invalidation hook: throws away the cached crawls, so that they are re-crawled right away
+# the old articles keep being shown until the new crawl finishes
+@app.route('/invalidate', methods=['POST'])
+def invalidate():
+  scrapers_cache.invalidate()
+  generalized_scraper_cache.invalidate()
 
-  return render_template('main.html', articles=articles)
+  return 'ok'
 
-app.run(host='0.0.0.0', port=8080)
\ No newline at end of file
+# only start the server when this file is run directly, so the app can also be imported (e.g. by a wsgi server)
+# to serve it with asyncio instead of a thread per page view, run asgi_app.py (see the top of that file)
+if __name__ == '__main__':
+  app.run(host='0.0.0.0', port=8080)
\ No newline at end of file
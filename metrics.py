@@ -0,0 +1,175 @@
+# This file measures how long every stage of scraping takes, per site, so that when the
+# website is slow we can see which site and which stage is responsible
+# The numbers are shown at /metrics in the Prometheus text format
+
+# The stages are:
+#   connect   opening the connection and waiting for the website's response headers
+#   download  downloading the body of the page
+#   parse     building the BeautifulSoup tree
+#   select    picking the article links and headlines out of the tree
+#   filter    keeping only the articles that match the keywords
+#   body      pulling the main text out of an article page (see article_bodies.py)
+#   render    rendering templates/main.html
+
+# Recording a measurement is just a few additions under a lock, and the text format is only
+# built when /metrics is actually requested, so this costs next to nothing when nobody looks at it
+
+# upper bounds (in seconds) of the histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+#######################################################
+## Configuration Ends Here, Actual Code Begins Below ##
+#######################################################
+
+import contextlib
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+
+
+# every metric that has been created, in the order they were created
+_all_metrics = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+        # one value per combination of labels, keyed by a sorted tuple of (label name, label value)
+        self._values = {}
+        _all_metrics.append(self)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.type_name}']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.extend(self._render_value(labels, value))
+        return lines
+
+    def _render_value(self, labels, value):
+        return [f'{self.name}{_format_labels(labels)} {value}']
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, description, buckets=DURATION_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        # the index of the first bucket this value fits in (len(buckets) means only +Inf)
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # one count per bucket, plus +Inf, plus the sum of every value
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bucket] += 1
+            counts[-1] += value
+
+    def _render_value(self, labels, counts):
+        # prometheus buckets are cumulative: each one counts every value less than or equal to it
+        lines = []
+        cumulative = 0
+        for upper_bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            bucket_labels = labels + (('le', upper_bound),)
+            lines.append(f'{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}')
+        lines.append(f'{self.name}_sum{_format_labels(labels)} {counts[-1]}')
+        lines.append(f'{self.name}_count{_format_labels(labels)} {cumulative}')
+        return lines
+
+
+stage_duration = Histogram('scraper_stage_duration_seconds', 'Time spent in each stage, per site')
+response_bytes = Counter('scraper_response_bytes_total', 'Bytes downloaded, per site')
+articles_found = Gauge('scraper_articles', 'Articles found by the last crawl, per site, before and after filtering')
+errors = Counter('scraper_errors_total', 'Errors, per site and stage')
+crawl_interval = Gauge('scraper_crawl_interval_seconds', 'Current time between two crawls, per site')
+
+
+# the site the current thread (or asyncio task, see asgi_app.py) is working on, so stages deep inside
+# the scrapers (like http_client downloading a page) know which site to label their measurements with
+_current_site = contextvars.ContextVar('current_site', default=None)
+
+
+"""
+    sets the site that measurements made by the current thread (or asyncio task) are labeled with
+    use it as: with metrics.site_label('BBC'): ...
+"""
+@contextlib.contextmanager
+def site_label(site):
+    token = _current_site.set(site)
+    try:
+        yield
+    finally:
+        _current_site.reset(token)
+
+
+"""
+    returns the site set by site_label, or default if there is none
+"""
+def current_site(default='unknown'):
+    return _current_site.get() or default
+
+
+"""
+    measures how long the code inside takes, as a stage of the current site
+    use it as: with metrics.timed('parse'): ...
+    an exception raised inside is counted in scraper_errors_total (and then raised again)
+"""
+@contextlib.contextmanager
+def timed(stage, site=None):
+    site = site or current_site()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        errors.inc(site=site, stage=stage)
+        raise
+    finally:
+        stage_duration.observe(time.perf_counter() - start, site=site, stage=stage)
+
+
+"""
+    returns every metric in the Prometheus text format
+"""
+def render_prometheus():
+    lines = []
+    for metric in _all_metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
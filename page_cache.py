@@ -0,0 +1,151 @@
+# This file keeps the rendered html of '/' and '/generalized_scraper', so that templates/main.html
+# is only rendered once per crawl, instead of on every page view
+# Every page is stored gzipped, with an ETag, so a page view is just a dictionary lookup, the browser
+# downloads a few times fewer bytes, and a browser that already has the page gets a "304 Not Modified"
+
+# The articles are split into pages of PAGE_SIZE articles (?page=2, ?page=3, ...), so websites
+# with thousands of articles don't turn into one page that is megabytes big
+
+# number of articles on each page
+PAGE_SIZE = 100
+
+# gzip compression level, from 1 (fastest) to 9 (smallest), a page is only compressed once per crawl
+GZIP_LEVEL = 9
+
+
+#######################################################
+## Configuration Ends Here, Actual Code Begins Below ##
+#######################################################
+
+import gzip
+import hashlib
+import threading
+
+
+"""
+    one rendered page, stored gzipped
+
+    etag(gzipped) is its strong ETag (without the quotes), which is different for the gzipped and
+    the plain version of the page, because they aren't the same bytes
+"""
+class RenderedPage:
+    def __init__(self, html):
+        content = html.encode('utf-8')
+        # mtime=0 so the same page always compresses to the exact same bytes
+        self.gzipped = gzip.compress(content, GZIP_LEVEL, mtime=0)
+        self.digest = hashlib.sha1(content).hexdigest()
+
+    def etag(self, gzipped):
+        return self.digest + ('-gzip' if gzipped else '')
+
+    def body(self, gzipped):
+        # almost every browser accepts gzip, so the plain version isn't kept around
+        return self.gzipped if gzipped else gzip.decompress(self.gzipped)
+
+
+"""
+    render_function takes (articles, page number, page count) and returns the html of that page,
+    articles being the {"headline": "url"} dictionary of only the articles on that page
+
+    the pages are kept until the version of the articles changes (see ArticleCache.version)
+"""
+class PageCache:
+    def __init__(self, render_function, page_size=PAGE_SIZE):
+        self.render_function = render_function
+        self.page_size = page_size
+
+        # (articles version, [(headline, url), ...] of every article, {page number: RenderedPage})
+        # replaced as a whole when the version changes, so a lookup never sees half of two versions
+        self._current = (None, None, {})
+        self._lock = threading.Lock()
+
+    """
+        returns the RenderedPage of that page of that version if it was already rendered, or None
+    """
+    def lookup(self, version, page_number):
+        current_version, _, pages = self._current
+        if current_version != version:
+            return None
+        return pages.get(page_number)
+
+    """
+        returns the RenderedPage of that page, rendering it if it isn't stored yet
+        articles_function takes no arguments and returns all the articles of that version,
+        it's only called once per version
+
+        returns None if there is no such page (the first page always exists, even with no articles)
+    """
+    def get(self, version, articles_function, page_number):
+        rendered = self.lookup(version, page_number)
+        if rendered is not None:
+            return rendered
+
+        with self._lock:
+            if self._current[0] != version:
+                self._current = (version, list(articles_function().items()), {})
+            _, articles, pages = self._current
+
+            page_count = max(1, -(-len(articles) // self.page_size))
+            if page_number < 1 or page_number > page_count:
+                return None
+
+            if page_number not in pages:
+                start = (page_number - 1) * self.page_size
+                page_articles = dict(articles[start:start + self.page_size])
+                pages[page_number] = RenderedPage(self.render_function(page_articles, page_number, page_count))
+            return pages[page_number]
+
+
+"""
+    picks what to send back for a RenderedPage, given the Accept-Encoding and If-None-Match
+    headers of the request (None if they weren't sent)
+
+    returns (status code, {header: value}, body)
+"""
+def respond(rendered, accept_encoding=None, if_none_match=None):
+    gzipped = accepts_gzip(accept_encoding)
+    etag = rendered.etag(gzipped)
+    headers = {
+        'ETag': f'"{etag}"',
+        # the same url has a gzipped and a plain version
+        'Vary': 'Accept-Encoding',
+        # browsers may keep the page, but have to check with the ETag that it's still the latest one
+        'Cache-Control': 'no-cache',
+    }
+
+    if if_none_match is not None and _matches(etag, if_none_match):
+        return 304, headers, b''
+
+    headers['Content-Type'] = 'text/html; charset=utf-8'
+    if gzipped:
+        headers['Content-Encoding'] = 'gzip'
+    return 200, headers, rendered.body(gzipped)
+
+
+# whether the Accept-Encoding header allows gzip (and doesn't turn it off with q=0)
+def accepts_gzip(accept_encoding):
+    for coding in (accept_encoding or '').split(','):
+        name, _, parameters = coding.partition(';')
+        if name.strip().lower() not in ('gzip', '*'):
+            continue
+        quality = parameters.strip().lower()
+        if quality.startswith('q='):
+            try:
+                return float(quality[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+# If-None-Match is * or a list of ETags, which are compared ignoring the W/ of weak ETags
+def _matches(etag, if_none_match):
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == f'"{etag}"':
+            return True
+    return False
@@ -0,0 +1,81 @@
+# This file moves the parsing of downloaded html into a pool of worker processes
+# Downloading is waiting on the network, which threads are good at, but building the BeautifulSoup
+# tree and running the css selectors is pure python work that holds the GIL, so with hundreds of
+# sites all the parsing would otherwise end up on a single cpu core
+
+# The scraping threads still download the html, then hand the raw bytes to a worker process and
+# wait (without holding the GIL) for a compact list of (headline, url) tuples to come back
+
+# number of worker processes that parse html
+# 0 parses in the scraping threads instead, which is faster when there are only a handful of sites,
+# because handing the html over to another process costs a little bit of time for every page
+# more workers than the machine has cpu cores don't parse any faster (check the parse_pool numbers
+# of python -m benchmarks.run_benchmarks on the machine the app runs on)
+PARSE_WORKERS = 0
+
+
+#######################################################
+## Configuration Ends Here, Actual Code Begins Below ##
+#######################################################
+
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+# the pool is only started the first time it's needed
+def _get_pool(workers):
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+        return _pool
+
+
+# runs inside the worker process
+# BeautifulSoup strings remember the whole tree they came from, so they are turned into plain
+# strings, otherwise the whole tree would be pickled and sent back to the scraping thread
+def _parse_in_worker(parse_function, html, parse_args):
+    articles = parse_function(html, *parse_args)
+    if articles is None:
+        return None
+    return [(str(headline), str(url)) for headline, url in articles.items()]
+
+
+"""
+    parse_function takes the raw html (and then parse_args) and returns a {"headline": "url"} dictionary
+    it has to be a function defined at the top level of a file, so the worker processes can find it
+
+    returns what parse_function returns, after running it in a worker process
+    (or right here, if workers is 0)
+"""
+def parse(parse_function, html, *parse_args, workers=None):
+    workers = PARSE_WORKERS if workers is None else workers
+    if not workers:
+        return parse_function(html, *parse_args)
+
+    # the parse and select stages happen in the worker process, where they can't be measured,
+    # so the whole round trip to the worker is measured as the parse stage instead
+    with metrics.timed('parse'):
+        articles = _get_pool(workers).submit(_parse_in_worker, parse_function, html, parse_args).result()
+
+    return None if articles is None else dict(articles)
+
+
+"""
+    stops the worker processes (they are started again the next time they're needed)
+"""
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
@@ -0,0 +1,281 @@
+# This file decides whether a headline is about the environment with a small machine learning
+# model, instead of only checking whether it contains one of the KEYWORDS
+# It can be used instead of filter_for_keywords, or together with it (see RELEVANCE_MODE in main.py)
+
+# The model is a logistic regression over "hashed" words: every word and every pair of words
+# next to each other in the headline is hashed into one of NUM_FEATURES slots, and each slot has
+# a weight. A headline's score is the sum of the weights of its slots, squashed into 0..1
+# Nothing has to be stored about which words exist, so words that were never seen while
+# training simply land in a slot with a (probably) small weight
+
+# The model is trained offline from a file of headlines you labeled yourself:
+#   python relevance_scorer.py train labeled_headlines.tsv
+# Each line of the file is a label (1 for environmental news, 0 for anything else),
+# then a tab, then the headline. Lines starting with # are skipped
+# Try it out with:
+#   python relevance_scorer.py score "Polar ice is melting faster than expected"
+
+# needs numpy (pip install numpy), which is only imported when the model is actually used
+
+import os
+
+# where the trained model is saved, and loaded from
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'relevance_model.npz')
+
+# headlines scoring at least this much (between 0 and 1) are kept
+RELEVANCE_THRESHOLD = 0.5
+
+# number of hashed word slots, more slots means fewer different words sharing a slot
+NUM_FEATURES = 2 ** 18
+
+# headlines are scored this many at a time, which keeps the memory used by huge crawls bounded
+SCORE_BATCH_SIZE = 10000
+
+# training settings
+EPOCHS = 20
+BATCH_SIZE = 256
+LEARNING_RATE = 0.5
+# how much large weights are punished, which stops the model from memorizing the training file
+L2_PENALTY = 1e-5
+
+
+#######################################################
+## Configuration Ends Here, Actual Code Begins Below ##
+#######################################################
+
+import argparse
+import threading
+import zlib
+
+import numpy as np
+
+import metrics
+from filter_for_keywords import normalize
+
+# the character that separates two headlines in a batch
+_SEPARATOR = '\x00'
+
+# punctuation is turned into spaces, so splitting on whitespace gives the words
+# (str.translate and str.split are several times faster than a regular expression here)
+_PUNCTUATION = ''.join(
+    character for character in map(chr, range(128)) if not character.isalnum() and character != _SEPARATOR
+) + '\u2018\u2019\u201c\u201d\u2013\u2014\u2026\u00ab\u00bb\u00a0'
+_SPLIT_WORDS = str.maketrans(_PUNCTUATION, ' ' * len(_PUNCTUATION))
+
+# the slot of every word seen so far, so each word is only hashed once
+# (python's own hash() is different in every run, so crc32 is used, to match the trained model)
+# the separator gets slot -1
+_word_slots = {_SEPARATOR: -1}
+# forget the slots once there are this many, so the memo can't grow forever
+_MAX_MEMO_SIZE = 1000000
+
+
+def _word_slot(word):
+    return zlib.crc32(word.encode('utf-8')) % NUM_FEATURES
+
+
+# turns a list of headlines into two arrays, the headline number and the slot of every feature
+# so headline i has the slots columns[rows == i]
+# the features are every word, and every pair of neighbouring words, of each headline
+def _vectorize(headlines):
+    # all the headlines are split into words at once
+    # the separator has spaces around it, so it ends up as a word of its own
+    text = f' {_SEPARATOR} '.join(headlines)
+    if text.count(_SEPARATOR) != len(headlines) - 1:
+        text = f' {_SEPARATOR} '.join(headline.replace(_SEPARATOR, ' ') for headline in headlines)
+    tokens = normalize(text).translate(_SPLIT_WORDS).split()
+
+    # a new memo is started instead of clearing the old one, because other threads may be using it
+    global _word_slots
+    word_slots = _word_slots
+    if len(word_slots) > _MAX_MEMO_SIZE:
+        word_slots = _word_slots = {_SEPARATOR: -1}
+    # only the words that were never seen before are hashed
+    for word in set(tokens).difference(word_slots):
+        word_slots[word] = _word_slot(word)
+    slots = np.fromiter(map(word_slots.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+
+    # the headline each token is in: the number of separators before it
+    is_separator = slots < 0
+    token_rows = np.cumsum(is_separator)
+
+    is_word = ~is_separator
+    word_rows = token_rows[is_word]
+    word_columns = slots[is_word]
+
+    # a pair of words gets a slot mixed from the slots of its two words
+    first, second = slots[:-1], slots[1:]
+    is_pair = (first >= 0) & (second >= 0)
+    pair_rows = token_rows[:-1][is_pair]
+    pair_columns = (first[is_pair] * 1000003 + second[is_pair] * 8191 + 1) % NUM_FEATURES
+
+    return np.concatenate([word_rows, pair_rows]), np.concatenate([word_columns, pair_columns])
+
+
+def _sigmoid(values):
+    return 1.0 / (1.0 + np.exp(-values))
+
+
+"""
+    a trained model
+    it's loaded once with load_scorer and then kept in memory, so every crawl reuses it
+"""
+class RelevanceScorer:
+    def __init__(self, weights, bias=0.0, threshold=RELEVANCE_THRESHOLD):
+        self.weights = weights
+        self.bias = bias
+        self.threshold = threshold
+
+    """
+        returns a numpy array with the score (0 to 1) of every headline in the list
+        the headlines are scored SCORE_BATCH_SIZE at once, in a handful of numpy operations per batch
+    """
+    def score(self, headlines):
+        headlines = list(headlines)
+        scores = np.empty(len(headlines))
+        for start in range(0, len(headlines), SCORE_BATCH_SIZE):
+            batch = headlines[start:start + SCORE_BATCH_SIZE]
+            rows, columns = _vectorize(batch)
+            # the sum of the weights of each headline's slots
+            totals = np.bincount(rows, weights=self.weights[columns], minlength=len(batch))
+            scores[start:start + len(batch)] = _sigmoid(totals + self.bias)
+        return scores
+
+    """
+        articles is a {"headline": "url"} dictionary
+
+        returns a new dictionary with only the articles scoring at least threshold
+        (the scorer's own threshold if it isn't given)
+    """
+    def filter(self, articles, threshold=None):
+        threshold = self.threshold if threshold is None else threshold
+        headlines = list(articles)
+        if not headlines:
+            return {}
+
+        keep = self.score(headlines) >= threshold
+        return {headline: articles[headline] for headline, kept in zip(headlines, keep) if kept}
+
+    def save(self, path=MODEL_PATH):
+        # np.savez adds .npz to the name if it isn't there, so write through an open file instead
+        with open(path, 'wb') as file:
+            np.savez_compressed(file, weights=self.weights, bias=self.bias, threshold=self.threshold)
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        with np.load(path) as model:
+            weights = model['weights']
+            if len(weights) != NUM_FEATURES:
+                raise ValueError(f'{path} was trained with {len(weights)} features, but NUM_FEATURES is {NUM_FEATURES}')
+            return cls(weights, float(model['bias']), float(model['threshold']))
+
+
+# the loaded models, keyed by path, so the model file is only read once
+# (or again when it's retrained, which changes the file's modification time)
+_loaded_scorers = {}
+_load_lock = threading.Lock()
+
+
+"""
+    returns the RelevanceScorer saved at path, loading it only the first time
+"""
+def load_scorer(path=MODEL_PATH):
+    modified_time = os.path.getmtime(path)
+    with _load_lock:
+        loaded = _loaded_scorers.get(path)
+        if loaded is None or loaded[0] != modified_time:
+            loaded = _loaded_scorers[path] = (modified_time, RelevanceScorer.load(path))
+        return loaded[1]
+
+
+"""
+    articles is a {"headline": "url"} dictionary
+
+    returns a new dictionary with only the articles the model thinks are environmental news
+"""
+def filter_for_relevance(articles, threshold=None, model_path=MODEL_PATH):
+    scorer = load_scorer(model_path)
+    with metrics.timed('filter'):
+        return scorer.filter(articles, threshold)
+
+
+# reads "label<tab>headline" lines
+def read_labeled_headlines(path):
+    headlines = []
+    labels = []
+    with open(path, encoding='utf-8') as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            label, separator, headline = line.partition('\t')
+            if not separator or label not in ('0', '1'):
+                raise ValueError(f'{path} line {line_number}: expected "1<tab>headline" or "0<tab>headline"')
+            headlines.append(headline)
+            labels.append(int(label))
+    return headlines, np.array(labels, dtype=np.float64)
+
+
+"""
+    trains a new RelevanceScorer on the headlines and their labels (1 or 0)
+    with mini-batch gradient descent, using the same batch vectorizing as scoring
+"""
+def train(headlines, labels, epochs=EPOCHS, learning_rate=LEARNING_RATE, l2_penalty=L2_PENALTY, threshold=RELEVANCE_THRESHOLD):
+    weights = np.zeros(NUM_FEATURES)
+    bias = 0.0
+    # same order every time, so training the same file twice gives the same model
+    random = np.random.default_rng(0)
+
+    for _ in range(epochs):
+        order = random.permutation(len(headlines))
+        for start in range(0, len(order), BATCH_SIZE):
+            batch = order[start:start + BATCH_SIZE]
+            rows, columns = _vectorize([headlines[index] for index in batch])
+            predictions = _sigmoid(np.bincount(rows, weights=weights[columns], minlength=len(batch)) + bias)
+
+            # gradient of the log loss: how far off each prediction was
+            errors = predictions - labels[batch]
+            weights *= 1.0 - learning_rate * l2_penalty
+            weights -= learning_rate * np.bincount(columns, weights=errors[rows], minlength=NUM_FEATURES) / len(batch)
+            bias -= learning_rate * errors.mean()
+
+    return RelevanceScorer(weights, bias, threshold)
+
+
+def _train_command(arguments):
+    headlines, labels = read_labeled_headlines(arguments.labeled_file)
+    if len(headlines) == 0:
+        raise SystemExit(f'{arguments.labeled_file} has no labeled headlines')
+
+    scorer = train(headlines, labels, epochs=arguments.epochs, threshold=arguments.threshold)
+    scorer.save(arguments.model)
+
+    accuracy = ((scorer.score(headlines) >= scorer.threshold) == (labels == 1)).mean()
+    print(f'trained on {len(headlines)} headlines ({int(labels.sum())} relevant), training accuracy {accuracy:.1%}')
+    print(f'saved the model to {arguments.model}')
+
+
+def _score_command(arguments):
+    scorer = load_scorer(arguments.model)
+    for headline, score in zip(arguments.headlines, scorer.score(arguments.headlines)):
+        print(f'{score:.3f}  {headline}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train or try out the headline relevance model')
+    parser.add_argument('--model', default=MODEL_PATH, help='where the model is saved')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = commands.add_parser('train', help='train a model from a file of labeled headlines')
+    train_parser.add_argument('labeled_file', help='file of "label<tab>headline" lines')
+    train_parser.add_argument('--epochs', type=int, default=EPOCHS)
+    train_parser.add_argument('--threshold', type=float, default=RELEVANCE_THRESHOLD,
+                              help='score a headline needs to be kept')
+    train_parser.set_defaults(run=_train_command)
+
+    score_parser = commands.add_parser('score', help='print the score of some headlines')
+    score_parser.add_argument('headlines', nargs='+')
+    score_parser.set_defaults(run=_score_command)
+
+    arguments = parser.parse_args()
+    arguments.run(arguments)
@@ -0,0 +1,124 @@
+# This file keeps track of every scraper function in the website_scrapers folder
+# Each scraper file marks its scraping function with @register_scraper, and importing
+# the file does nothing else (no scraping, no network requests)
+
+# The scraper files are only imported the first time they are needed, and never again after that,
+# so page views don't pay for importing them
+
+# To also be downloaded without blocking when the app runs with asgi_app.py, a scraper file has a
+# `website` variable (the url of the page it scrapes) and a parse function named after the scraper
+# (scrape_bbc -> parse_bbc) that takes the raw html, like the scrapers in website_scrapers do
+# Other scrapers still work there too, they just run in a thread like in the normal app
+
+import os
+import pkgutil
+import sys
+import threading
+from functools import wraps
+from importlib import import_module
+
+import http_cache
+from async_scraping import run_in_thread
+
+
+# every registered scraper function, keyed by "module name.function name"
+_registered_scrapers = {}
+
+# the results of load_scrapers, so every folder/scrapers combination is only loaded once
+_loaded_scrapers = {}
+_load_lock = threading.Lock()
+
+
+"""
+    decorator for scraping functions, so they can be found by load_scrapers:
+
+    @register_scraper
+    def scrape_my_website():
+        ...
+"""
+def register_scraper(scraper_function):
+    _registered_scrapers[scraper_function.__module__ + '.' + scraper_function.__name__] = scraper_function
+    return scraper_function
+
+
+"""
+    returns the url of the website a scraper function scrapes
+    (the `website` variable in the scraper's file), or None if its file doesn't have one
+"""
+def scraper_website(scraper_function):
+    return getattr(sys.modules.get(scraper_function.__module__), 'website', None)
+
+
+"""
+    returns an async version of a scraper function, for asgi_app.py
+
+    the page is downloaded with async_http_client and parsed in a thread, using the same http
+    cache entries as the scraper function itself (see the top of this file)
+"""
+def async_scraper(scraper_function):
+    module = sys.modules.get(scraper_function.__module__)
+    website = getattr(module, 'website', None)
+    parse_function = None
+    if scraper_function.__name__.startswith('scrape_'):
+        parse_function = getattr(module, 'parse_' + scraper_function.__name__[len('scrape_'):], None)
+
+    @wraps(scraper_function)
+    async def scrape_async():
+        if website is None or parse_function is None:
+            return await run_in_thread(scraper_function)
+        return await http_cache.scrape_cached_async(website, parse_function, parse_key=parse_function.__name__)
+
+    return scrape_async
+
+
+"""
+    returns a list of scraper functions from folder_name
+
+    scrapers is a list of [file name, function name] pairs (like the SCRAPERS array in main.py)
+    if scrapers is None, every function marked with @register_scraper in the folder is returned
+
+    the scraper files are imported the first time this is called, after that the
+    same list is returned straight away
+"""
+def load_scrapers(folder_name, scrapers=None):
+    key = (folder_name, None if scrapers is None else tuple(map(tuple, scrapers)))
+
+    with _load_lock:
+        if key not in _loaded_scrapers:
+            if scrapers is None:
+                _loaded_scrapers[key] = _discover_scrapers(folder_name)
+            else:
+                _loaded_scrapers[key] = _import_scrapers(folder_name, scrapers)
+        return list(_loaded_scrapers[key])
+
+
+# imports every file in the folder, which registers all their scrapers
+def _discover_scrapers(folder_name):
+    folder_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), folder_name)
+    for module_info in pkgutil.iter_modules([folder_path]):
+        import_module(folder_name + '.' + module_info.name)
+
+    return [
+        scraper_function
+        for name, scraper_function in sorted(_registered_scrapers.items())
+        if name.startswith(folder_name + '.')
+    ]
+
+
+# imports the scraper functions from the [file name, function name] pairs
+def _import_scrapers(folder_name, scrapers):
+    all_scraper_functions = []
+
+    for file_name, function_name in scrapers:
+        # remove the .py from end if its included in original file_name
+        # this is because import_module only takes in the file_name without any .py extension
+        if file_name.endswith('.py'):
+            file_name = file_name[:-3]
+
+        # import the file containing the scraping function
+        scraper_file = import_module(folder_name + '.' + file_name)
+
+        # get the actual scraping function from the imported file
+        all_scraper_functions.append(getattr(scraper_file, function_name))
+
+    return all_scraper_functions
@@ -0,0 +1,140 @@
+# This file loads the websites scraped by the generalized scraper from sites.json
+# See the top of generalized_scraper.py for what every key of a website means
+
+# The file is checked once when it's loaded (so a typo in a css selector is reported right away,
+# not in the middle of a crawl), and loaded again whenever it changes, so websites can be
+# added or fixed without restarting the app
+# If the changed file has a mistake in it, the mistake is printed and the websites
+# from before the change keep being used
+
+import os
+
+# the file the websites are in
+SITES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sites.json')
+
+
+#######################################################
+## Configuration Ends Here, Actual Code Begins Below ##
+#######################################################
+
+import json
+import threading
+
+import soupsieve
+
+from html_parsing import compile_selector
+from http_client import FETCH_OPTIONS
+
+# every key a website can have, and the types its value can be
+_REQUIRED_KEYS = {
+    'name': (str,),
+    'url': (str,),
+    'prefix': (str,),
+    'link_selector': (str,),
+    'headline_selector': (str, type(None)),
+}
+_OPTIONAL_KEYS = {
+    'parser': (str,),
+    'parse_only': (str, type(None)),
+    **{option: (int, float) for option in FETCH_OPTIONS},
+}
+_PARSERS = ('html.parser', 'lxml', 'html5lib')
+
+
+"""
+    raised when sites.json has a mistake in it
+"""
+class SiteConfigError(ValueError):
+    pass
+
+
+"""
+    sites is the list of website dictionaries read from sites.json
+
+    raises SiteConfigError describing the first mistake found
+    (the css selectors are compiled here too, so they are ready for the first crawl)
+"""
+def validate_sites(sites):
+    if not isinstance(sites, list):
+        raise SiteConfigError('the file must contain a list of websites')
+
+    names = set()
+    for number, website in enumerate(sites, 1):
+        if not isinstance(website, dict):
+            raise SiteConfigError(f'website {number} must be an object')
+        where = f'website {number} ({website.get("name", "no name")})'
+
+        for key, types in _REQUIRED_KEYS.items():
+            if key not in website:
+                raise SiteConfigError(f'{where} is missing "{key}"')
+        for key, value in website.items():
+            types = _REQUIRED_KEYS.get(key) or _OPTIONAL_KEYS.get(key)
+            if types is None:
+                raise SiteConfigError(f'{where} has an unknown key "{key}"')
+            # bool is a kind of int in python, but true/false is never a valid setting
+            if not isinstance(value, types) or isinstance(value, bool):
+                raise SiteConfigError(f'{where} has the wrong type of value for "{key}"')
+
+        if website['name'] in names:
+            raise SiteConfigError(f'{where} has the same name as another website')
+        names.add(website['name'])
+
+        if not website['url'].startswith(('http://', 'https://')):
+            raise SiteConfigError(f'{where} has a url that doesn\'t start with http:// or https://')
+        if website.get('parser', 'html.parser') not in _PARSERS:
+            raise SiteConfigError(f'{where} has an unknown parser, it must be one of {", ".join(_PARSERS)}')
+
+        for key in ('link_selector', 'headline_selector'):
+            if website[key] is None:
+                continue
+            try:
+                compile_selector(website[key])
+            except soupsieve.SelectorSyntaxError as error:
+                raise SiteConfigError(f'{where} has an invalid {key}: {error}')
+
+
+# the websites of every file loaded so far: {path: (modification time, websites)}
+_loaded_sites = {}
+_load_lock = threading.Lock()
+
+
+"""
+    returns the list of website dictionaries in the file at path
+
+    the file is only read again when it has changed since the last call, otherwise
+    the exact same list is returned (so `is` tells whether the websites changed)
+
+    raises SiteConfigError if the file can't be loaded the first time, later on
+    a broken file is only printed, and the websites from before keep being used
+"""
+def load_sites(path=SITES_PATH):
+    try:
+        modified_time = os.path.getmtime(path)
+    except OSError as error:
+        modified_time = None
+        missing_error = error
+
+    with _load_lock:
+        loaded = _loaded_sites.get(path)
+        if loaded is not None and loaded[0] == modified_time:
+            return loaded[1]
+
+        try:
+            if modified_time is None:
+                raise SiteConfigError(f'could not read {path}: {missing_error}')
+            try:
+                with open(path, encoding='utf-8') as file:
+                    sites = json.load(file)
+            except (OSError, ValueError) as error:
+                raise SiteConfigError(f'could not read {path}: {error}')
+            validate_sites(sites)
+        except SiteConfigError as error:
+            if loaded is None:
+                raise
+            print(f'Not reloading {path}, it has a mistake: {error}')
+            # don't try the same broken file again on every call
+            _loaded_sites[path] = (modified_time, loaded[1])
+            return loaded[1]
+
+        _loaded_sites[path] = (modified_time, sites)
+        return sites
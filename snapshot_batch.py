@@ -0,0 +1,213 @@
+# This file re-runs the generalized scraper over html pages that were saved earlier, instead of
+# downloading them, e.g. to see what the articles of past crawls would have been with new
+# css selectors in sites.json, or with new KEYWORDS
+# Run it through the generalized scraper:
+#   python generalized_scraper.py --batch snapshots/ --output articles.jsonl
+
+# The snapshots are either a folder, or a single .tar archive (optionally .tar.gz / .tar.bz2 / .tar.xz)
+# with the same layout inside: one folder per website, named after the website's 'name' in
+# sites.json, containing any number of saved pages of that website, e.g.
+#   snapshots/Mlive/2021-03-01T12-00.html
+#   snapshots/Detroit News/2021-03-01T12-00.html
+# (the folder name can also be the name in lowercase with _ instead of spaces, like detroit_news)
+
+# Every article found is written to the output as one line of json (JSON Lines), as soon as its
+# page is done, so the output can be read while it is still being written
+# The pages are read with memory-mapped files and parsed by a pool of worker processes, and only a
+# few pages are in flight at once, so the memory used doesn't grow with the size of the snapshots
+
+import os
+
+# number of worker processes that parse the pages (0 parses them in this process)
+BATCH_WORKERS = os.cpu_count() or 1
+
+# number of pages waiting for (or being parsed by) each worker at once
+PAGES_PER_WORKER = 4
+
+
+#######################################################
+## Configuration Ends Here, Actual Code Begins Below ##
+#######################################################
+
+import json
+import mmap
+import re
+import sys
+import tarfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from filter_for_keywords import filter_relevant
+from generalized_scraper import extract_articles
+from html_parsing import DEFAULT_PARSER
+
+
+# 'Detroit News' -> 'detroit_news', so folder names don't need spaces or & in them
+def _folder_name(site_name):
+    return re.sub(r'[^a-z0-9]+', '_', site_name.lower()).strip('_')
+
+
+"""
+    path is a folder or a tar archive of snapshots
+
+    yields a (folder name, snapshot name, reference) tuple for every saved page, in order
+    the reference is what _read_snapshot needs to read the page, which is small, so it can be
+    sent to a worker process cheaply (the worker reads the page itself)
+"""
+def iter_snapshots(path):
+    if os.path.isdir(path):
+        yield from _iter_folder(path)
+    elif tarfile.is_tarfile(path):
+        yield from _iter_archive(path)
+    else:
+        raise ValueError(f'{path} is neither a folder nor a tar archive')
+
+
+def _iter_folder(path):
+    for folder, subfolders, files in os.walk(path):
+        # walk in a fixed order, and skip hidden folders and files
+        subfolders[:] = sorted(name for name in subfolders if not name.startswith('.'))
+        relative_folder = os.path.relpath(folder, path)
+        if relative_folder == '.':
+            for name in files:
+                print(f'Skipping {name}, it is not inside a website folder', file=sys.stderr)
+            continue
+
+        site_folder = relative_folder.split(os.sep)[0]
+        for name in sorted(files):
+            if name.startswith('.'):
+                continue
+            file_path = os.path.join(folder, name)
+            yield site_folder, os.path.join(relative_folder, name), ('file', file_path, 0, os.path.getsize(file_path))
+
+
+def _iter_archive(path):
+    # the pages of an uncompressed archive are memory-mapped by the workers themselves, a compressed
+    # archive has to be decompressed here instead, reading it as a stream (r|*) from start to end
+    try:
+        archive = tarfile.open(path, 'r:')
+        compressed = False
+    except tarfile.ReadError:
+        archive = tarfile.open(path, 'r|*')
+        compressed = True
+
+    with archive:
+        for member in archive:
+            # tarfile remembers every member it has seen, which grows forever on a huge archive
+            archive.members = []
+            if not member.isfile():
+                continue
+
+            # archives made with tar -C snapshots . have ./ in front of every name
+            name = member.name[2:] if member.name.startswith('./') else member.name
+            parts = name.split('/')
+            if len(parts) < 2:
+                print(f'Skipping {name}, it is not inside a website folder', file=sys.stderr)
+                continue
+
+            if compressed:
+                reference = ('bytes', archive.extractfile(member).read())
+            else:
+                reference = ('file', path, member.offset_data, member.size)
+            yield parts[0], name, reference
+
+
+# returns the raw html of a snapshot
+def _read_snapshot(reference):
+    if reference[0] == 'bytes':
+        return reference[1]
+
+    _, path, offset, size = reference
+    if size == 0:
+        return b''
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as memory:
+        # only this page is copied out of the file, not the whole file
+        return memory[offset:offset + size]
+
+
+# runs in a worker process: reads one snapshot, and returns the {"headline": "url"} of its articles
+def process_snapshot(reference, website, keywords, relevance_mode):
+    articles = extract_articles(
+        _read_snapshot(reference),
+        website['prefix'],
+        website['link_selector'],
+        website['headline_selector'],
+        website.get('parser', DEFAULT_PARSER),
+        website.get('parse_only', 'links'),
+    )
+    if keywords is not None:
+        articles = filter_relevant(articles, keywords, relevance_mode)
+    return articles
+
+
+"""
+    path is a folder or tar archive of snapshots (see the top of this file)
+    output is a text file the JSON Lines are written to
+    websites is the list of website dictionaries (like the ones in sites.json)
+    if keywords is given, only the relevant articles are written (see filter_for_keywords.filter_relevant)
+
+    writes one {"site", "snapshot", "headline", "url"} line per article, in the order of the snapshots
+
+    returns the number of (snapshots, articles) written
+"""
+def run_batch(path, output, websites, keywords=None, relevance_mode='keywords', workers=BATCH_WORKERS):
+    websites_by_folder = {}
+    for website in websites:
+        websites_by_folder[website['name']] = website
+        websites_by_folder[_folder_name(website['name'])] = website
+    keywords = None if keywords is None else tuple(keywords)
+
+    snapshot_count = 0
+    article_count = 0
+    pool = ProcessPoolExecutor(max_workers=workers) if workers else None
+    # the snapshots being parsed, oldest first, so the output keeps the order of the snapshots
+    in_flight = deque()
+
+    def write_oldest():
+        nonlocal snapshot_count, article_count
+        website, snapshot_name, future = in_flight.popleft()
+        try:
+            articles = future.result()
+        except Exception as error:
+            print(f'Something went wrong with {snapshot_name}: {error}', file=sys.stderr)
+            return
+        for headline, url in articles.items():
+            output.write(json.dumps(
+                {'site': website['name'], 'snapshot': snapshot_name, 'headline': headline, 'url': url},
+                ensure_ascii=False,
+            ) + '\n')
+        snapshot_count += 1
+        article_count += len(articles)
+
+    try:
+        for site_folder, snapshot_name, reference in iter_snapshots(path):
+            website = websites_by_folder.get(site_folder) or websites_by_folder.get(_folder_name(site_folder))
+            if website is None:
+                print(f'Skipping {snapshot_name}, there is no website called {site_folder}', file=sys.stderr)
+                continue
+
+            if pool is None:
+                future = Future()
+                try:
+                    future.set_result(process_snapshot(reference, website, keywords, relevance_mode))
+                except Exception as error:
+                    future.set_exception(error)
+            else:
+                future = pool.submit(process_snapshot, reference, website, keywords, relevance_mode)
+            in_flight.append((website, snapshot_name, future))
+
+            # wait for the oldest page once enough are in flight, which keeps the memory flat
+            while len(in_flight) > max(1, workers) * PAGES_PER_WORKER:
+                write_oldest()
+
+        while in_flight:
+            write_oldest()
+    finally:
+        if pool is not None:
+            # if something went wrong, don't parse the rest of the queued pages
+            for _, _, future in in_flight:
+                future.cancel()
+            pool.shutdown()
+
+    output.flush()
+    return snapshot_count, article_count
@@ -1,21 +1,31 @@
-from bs4 import BeautifulSoup
-import requests
+from bs4 import SoupStrainer
+from html_parsing import make_soup
+import metrics
+import http_cache
+from scraper_registry import register_scraper
 import re
 
+website = "https://www.bbc.com/news/science_and_environment"
+
 """ returns a scraped {title: link} dict from bbc """
+@register_scraper
 def scrape_bbc():
-    website = "https://www.bbc.com/news/science_and_environment"
+    # only downloads and parses the page again if it changed since the last crawl
+    return http_cache.scrape_cached(website, parse_bbc, parse_key="parse_bbc")
+
+""" returns a {title: link} dict from the html of the bbc page """
+def parse_bbc(html):
     # pattern is a regular expression for something that the links we actually want will contain
     pattern = re.compile("/news/science-environment")
 
     """ actual code starts here: """
 
-    # grab html from website
-    html = requests.get(website).text
-
     # parse out the link tags (<a></a>) from the html
-    soup = BeautifulSoup(html, features="html.parser")
-    all_link_tags = soup.find_all("a", href=pattern)
+    # only the <a> tags (and what's inside them) are parsed, with the faster lxml parser
+    with metrics.timed("parse"):
+        soup = make_soup(html, "lxml", parse_only=SoupStrainer("a"))
+    with metrics.timed("select"):
+        all_link_tags = soup.find_all("a", href=pattern)
 
     articles = {}
     for tag in all_link_tags:
@@ -29,7 +39,8 @@ def scrape_bbc():
 
         # if you made it this far, the headline_tag exists and can be added
         # grab the actual headline from the <h3> tag
-        headline = headline_tag.contents[0]
+        # (as a plain string, a bs4 NavigableString would keep the whole parsed page in memory)
+        headline = str(headline_tag.contents[0])
 
         # href is the attribute inside which the actual link url is stored
         url = tag["href"]
@@ -40,4 +51,6 @@ def scrape_bbc():
             
     return articles
 
-print( scrape_bbc() )
\ No newline at end of file
+# only scrape when run directly (python -m website_scrapers.scrape_bbc), never on import
+if __name__ == '__main__':
+    print( scrape_bbc() )
\ No newline at end of file
@@ -1,17 +1,24 @@
-from bs4 import BeautifulSoup
-import requests
+from bs4 import SoupStrainer
+from html_parsing import make_soup
+import metrics
+import http_cache
+from scraper_registry import register_scraper
 import unicodedata
 
+website = 'https://www.detroitnews.com/news/'
+
+@register_scraper
 def scrape_detroit_news():
-    website = 'https://www.detroitnews.com/news/'
-    
-    # get html from website
-    html = requests.get(website).text
+    # only downloads and parses the page again if it changed since the last crawl
+    return http_cache.scrape_cached(website, parse_detroit_news, parse_key='parse_detroit_news')
 
+def parse_detroit_news(html):
     # parse html to find the link
-    soup = BeautifulSoup(html, features="html.parser")
-    all_link_tags = soup.find_all("a", class_="gnt_m_flm_a")
-    print(all_link_tags)
+    # only the <a> tags (and what's inside them) are parsed, with the faster lxml parser
+    with metrics.timed("parse"):
+        soup = make_soup(html, "lxml", parse_only=SoupStrainer("a"))
+    with metrics.timed("select"):
+        all_link_tags = soup.find_all("a", class_="gnt_m_flm_a")
     # make an empty dictionary to contain articles to return later
     articles = {}
 
@@ -24,11 +31,14 @@ def scrape_detroit_news():
       #title = tag.find_all({"data-c-br":"")
       if len(tag["class"]) > 1:
         continue
-      if not tag.has_attr("href"):
-        return
+      # skip links without a url or a headline, instead of giving up on the whole page
+      if not tag.has_attr("href") or not tag.has_attr("data-c-br"):
+        continue
 
       title = unicodedata.normalize("NFKD", tag["data-c-br"])
       articles[title] = "https://www.detroitnews.com" + tag["href"]
     return articles
 
-print( scrape_detroit_news() )
\ No newline at end of file
+# only scrape when run directly (python -m website_scrapers.scrape_detroit_news), never on import
+if __name__ == '__main__':
+    print( scrape_detroit_news() )
\ No newline at end of file
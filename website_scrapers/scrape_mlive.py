@@ -1,16 +1,24 @@
-from bs4 import BeautifulSoup
-import requests
+from bs4 import SoupStrainer
+from html_parsing import make_soup
+import metrics
+import http_cache
+from scraper_registry import register_scraper
 
-def scrape_mlive():
-    website = "https://www.mlive.com/"
+website = "https://www.mlive.com/"
 
-    # grab html from website
-    html = requests.get(website).text
+@register_scraper
+def scrape_mlive():
+    # only downloads and parses the page again if it changed since the last crawl
+    return http_cache.scrape_cached(website, parse_mlive, parse_key="parse_mlive")
 
+def parse_mlive(html):
     # parse out the link tags (<a></a>) from the html
     # only select tags with attribute data-ga-content-type = article
-    soup = BeautifulSoup(html, features="html.parser")
-    all_link_tags = soup.find_all("a", {"data-ga-content-type":"article"})
+    # only the <a> tags (and what's inside them) are parsed, with the faster lxml parser
+    with metrics.timed("parse"):
+        soup = make_soup(html, "lxml", parse_only=SoupStrainer("a"))
+    with metrics.timed("select"):
+        all_link_tags = soup.find_all("a", {"data-ga-content-type":"article"})
 
     articles = {}
 
@@ -21,8 +29,11 @@ def scrape_mlive():
         continue
         #tag headline can be obtained at tag.string
         #tag url stored in the attribute "href", accessed with tag["href"] 
-      articles[tag.string] = tag["href"]
+      #str() so the headline doesn't keep the whole parsed page in memory
+      articles[str(tag.string)] = tag["href"]
             
     return articles
 
-print( scrape_mlive() )
\ No newline at end of file
+# only scrape when run directly (python -m website_scrapers.scrape_mlive), never on import
+if __name__ == '__main__':
+    print( scrape_mlive() )
\ No newline at end of file